@@ -0,0 +1,203 @@
+import os
+import sys
+import json
+import time
+import timeit
+import random
+import platform
+import tempfile
+import tracemalloc
+import numpy as np
+import train
+from train import Agent
+from state_space import VALID_RAW, encode, encode_raw, decode_raw, blur
+
+# 训练和测试热点路径的基准测试，所有随机数都使用固定的种子
+HYPERPARAMETER_DICT = {
+    "ALPHA_0": 0.2,
+    "ALPHA_FIRST_DECAY_EPISODES": 20,
+    "ALPHA_MIDDLE": 0.05,
+    "ALPHA_MIN": 0.02,
+    "ALPHA_SECOND_DECAY_EPISODES": 180,
+    "COPY_PER_ROUND": 50000,
+    "GAMMA": 0.9,
+    "ROUND_PER_TEST": 2000,
+    "SMOOTHNESS": 5,
+    "TEMPERATURE_0": 2.0,
+    "TEMPERATURE_DECAY_ROUNDS": 400000,
+    "TEMPERATURE_MIN": 0.1,
+    "TEMPERATURE_TEST": 0.1,
+    "TEST_PER_ROUND": 5000,
+    "TOTAL_GAME_ROUND": 500000
+}
+RAW_STATES = [decode_raw(raw_id) for raw_id in VALID_RAW]
+STATES = [(own, blur(opponent)) for own in RAW_STATES for opponent in RAW_STATES]  # Q 表中的状态，对方状态已模糊
+
+
+def make_agent(seed=0):  # 用随机的 Q 值代替训练好的 Q 表，使每个状态的动作概率各不相同
+    random.seed(seed)
+    agent = Agent()
+    agent.HYPERPARAMETER_DICT = dict(HYPERPARAMETER_DICT)
+    agent.Q_table.reward = np.where(agent.Q_table.legal, np.random.default_rng(seed).normal(size=agent.Q_table.reward.shape), -np.inf)
+    agent.game_round = 100000  # 训练温度处于衰减的中途
+    return agent
+
+
+def rate(function, number, repeat=5):  # 取 repeat 次中最快的一次，返回每秒调用次数
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for i in range(number):
+            function(i)
+        best = min(best, time.perf_counter() - start)
+    return number / best
+
+
+def latency(function, repeat=5):  # 同 timeit.Timer.autorange，每次重复连续调用到至少 0.2 秒，取 repeat 次中最快的一次，返回每次调用的毫秒数
+    timer = timeit.Timer(function)
+    number = timer.autorange()[0]  # 不足一毫秒的项目单次计时的抖动很大，多次调用取平均
+    return min(timer.repeat(repeat, number)) / number * 1000
+
+
+def bench_judge(agent):
+    rules = agent.rules
+    rng = np.random.default_rng(1)
+    cases = []
+    while len(cases) < 4096:
+        a, b = RAW_STATES[rng.integers(len(RAW_STATES))], RAW_STATES[rng.integers(len(RAW_STATES))]
+        legal_a, legal_b = np.flatnonzero(rules.legal[encode_raw(a)]), np.flatnonzero(rules.legal[encode_raw(b)])
+        cases.append((a, b, rules.actions[rng.choice(legal_a)], rules.actions[rng.choice(legal_b)]))
+    return rate(lambda i: Agent.judge(*cases[i % len(cases)], rules), 100000)
+
+
+def bench_choose_action(agent, use_random):
+    random.seed(2)
+    states = [STATES[i] for i in np.random.default_rng(2).integers(len(STATES), size=4096)]
+    return rate(lambda i: agent.choose_action(states[i % len(states)], use_random), 50000)
+
+
+def bench_update_q_table(agent):
+    random.seed(3)
+    rng = np.random.default_rng(3)
+    cases = []
+    for index in rng.integers(len(STATES), size=4096):
+        state = STATES[index]
+        legal = np.flatnonzero(agent.Q_table.legal[encode(state)])
+        cases.append((state, STATES[rng.integers(len(STATES))], agent.Q_table.actions[rng.choice(legal)], float(rng.choice([-10, 0, 10]))))
+    reward, episode = agent.Q_table.reward.copy(), agent.Q_table.episode.copy()
+    result = rate(lambda i: agent.update_q_table(*cases[i % len(cases)]), 50000)
+    agent.Q_table.reward, agent.Q_table.episode = reward, episode
+    agent.Q_table.invalidate()
+    return result
+
+
+def bench_play_round(agent, opponent):
+    reward, episode = agent.Q_table.reward.copy(), agent.Q_table.episode.copy()
+    random.seed(4)
+    result = rate(lambda i: agent.play_round(i % 5 < 3, opponent), 2000)
+    agent.Q_table.reward, agent.Q_table.episode = reward, episode
+    agent.Q_table.invalidate()
+    return result
+
+
+def bench_test(agent, opponent, mode):
+    agent.HYPERPARAMETER_DICT["TEST_MODE"] = mode
+    random.seed(5)
+    result = latency(lambda: Agent.test(agent, opponent, "benchmark"), 3)
+    del agent.HYPERPARAMETER_DICT["TEST_MODE"]
+    agent.test_data.clear()
+    return result
+
+
+def bench_make_map(agent):
+    with tempfile.TemporaryDirectory() as directory:
+        agent.map_path = os.path.join(directory, "map.frames")
+        return latency(agent.make_map, 10)
+
+
+def bench_memory(games):  # 历史池满的情况下训练 games 局的峰值内存
+    agent = make_agent(6)
+    randomer, loopers, history = train.Foolish(agent.MOVEMENT_TABLE), train.make_loopers(), []
+    tracemalloc.start()
+    for _ in range(20):
+        train.add_history(history, agent)
+    for _ in range(games):
+        train.play_game(agent, history, loopers, randomer)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak / 2 ** 20
+
+
+def run():  # 返回 {名称: {"value": 数值, "unit": 单位, "higher_is_better": 越大越好}}
+    agent = make_agent()
+    randomer, loopers = train.Foolish(agent.MOVEMENT_TABLE), train.make_loopers()
+    snapshot = train.FrozenPolicy.from_agent(agent)
+    results = {}
+
+    def record(name, value, unit, higher_is_better):
+        results[name] = {"value": value, "unit": unit, "higher_is_better": higher_is_better}
+        print(f"{name:<36}{value:>14.2f} {unit}", flush=True)
+
+    record("judge", bench_judge(agent), "calls/s", True)
+    record("choose_action_train", bench_choose_action(agent, True), "calls/s", True)
+    record("choose_action_test", bench_choose_action(agent, False), "calls/s", True)
+    record("update_q_table", bench_update_q_table(agent), "calls/s", True)
+    record("play_round_randomer", bench_play_round(agent, randomer), "games/s", True)
+    record("play_round_looper", bench_play_round(agent, loopers[0]), "games/s", True)
+    record("play_round_snapshot", bench_play_round(agent, snapshot), "games/s", True)
+    record("play_round_self", bench_play_round(agent, agent), "games/s", True)
+    record("test_sample", bench_test(agent, loopers[0], "sample"), "ms", False)
+    record("test_exact", bench_test(agent, loopers[0], "exact"), "ms", False)
+    record("make_map", bench_make_map(agent), "ms", False)
+    record("peak_memory", bench_memory(2000), "MiB", False)
+    return results
+
+
+def compare(results, baseline, threshold):  # 与基准结果比较，返回变差超过 threshold 的项目
+    regressions = []
+    print(f"{'name':<24}{'baseline':>14}{'current':>14}{'change':>10}")
+    for name, result in results.items():
+        if name not in baseline["results"]:
+            continue
+        old, new = baseline["results"][name]["value"], result["value"]
+        change = new / old - 1 if old != 0 else 0.0
+        worse = -change if result["higher_is_better"] else change
+        flag = ""
+        if worse > threshold:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:<24}{old:>14.2f}{new:>14.2f}{change:>+10.1%}{flag}")
+    return regressions
+
+
+def main(args):  # benchmark.py [输出路径] [--baseline 基准结果路径] [--threshold 允许变差的比例]
+    path, baseline, threshold = "benchmark.json", None, 0.1
+    i = 0
+    while i < len(args):
+        if args[i] == "--baseline":
+            baseline, i = args[i + 1], i + 2
+        elif args[i] == "--threshold":
+            threshold, i = float(args[i + 1]), i + 2
+        else:
+            path, i = args[i], i + 1
+    results = run()
+    with open(path, "w") as f:
+        json.dump({
+            "time": time.strftime('%Y-%m-%d_%H-%M-%S', time.localtime()),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "results": results
+        }, f, indent=2)
+    print(f"Saved benchmark results in file {path}")
+    if baseline is not None:
+        with open(baseline, "r") as f:
+            regressions = compare(results, json.load(f), threshold)
+        if len(regressions) > 0:
+            print(f"{len(regressions)} regression(s) over {threshold:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+        print(f"No regression over {threshold:.0%}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
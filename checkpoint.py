@@ -0,0 +1,136 @@
+import os
+import json
+import random
+import shutil
+import numpy as np
+import train
+import strategy_map
+from lockstep import LockstepGames
+
+# 检查点是一个文件夹：manifest.json 保存计数、超参数、测试数据和随机状态，数组都是不压缩的 .npy，可以用 mmap_mode 直接映射
+VERSION = 1
+
+
+def describe(opponent, trainee, loopers, randomer, snapshots):  # 把对手转换成可以写入 JSON 的描述
+    if opponent is trainee:
+        return ["trainee"]
+    if opponent is randomer:
+        return ["randomer"]
+    for i, looper in enumerate(loopers):
+        if opponent is looper:
+            return ["looper", i]
+    for i, snapshot in enumerate(snapshots):
+        if opponent is snapshot:
+            return ["snapshot", i]
+    raise ValueError("Unknown opponent")
+
+
+def resolve(description, trainee, loopers, randomer, snapshots):  # describe 的逆操作
+    if description[0] == "trainee":
+        return trainee
+    if description[0] == "randomer":
+        return randomer
+    if description[0] == "looper":
+        return loopers[description[1]]
+    return snapshots[description[1]]
+
+
+def save(path, trainee, history, engine, next_test, loopers, randomer):
+    temporary = path + ".tmp"
+    shutil.rmtree(temporary, ignore_errors=True)
+    os.makedirs(temporary)
+    np.save(os.path.join(temporary, "reward.npy"), trainee.Q_table.reward)
+    np.save(os.path.join(temporary, "episode.npy"), trainee.Q_table.episode)
+    snapshots = list(history)
+    if isinstance(engine, LockstepGames):  # 已被移出历史池、但还在对局中的快照也要保存
+        snapshots += [o for o in engine.opponents if isinstance(o, train.FrozenPolicy) and all(o is not h for h in history)]
+    if len(snapshots) > 0:
+        np.save(os.path.join(temporary, "snapshots.npy"), np.stack([s.reward for s in snapshots]))
+    manifest = {
+        "version": VERSION,
+        "HYPERPARAMETER_DICT": trainee.HYPERPARAMETER_DICT,
+        "game_round": trainee.game_round,
+        "total_round": trainee.total_round,
+        "next_test": next_test,
+        "test_data": trainee.test_data,
+        "random_state": random.getstate(),
+        "snapshots": [[s.temperature, s.temperature_test] for s in snapshots],
+        "history": len(history),  # 前 len(history) 个快照即为历史池
+        "lockstep": None,
+        "replay": None,
+        "trajectory": None,  # 轨迹文件中属于这个检查点的记录数，继续训练时截断多出来的记录
+        "map": strategy_map.count_frames(trainee.map_path)  # 策略图帧文件中属于这个检查点的帧数，同上
+    }
+    if trainee.replay is not None:
+        for name in trainee.replay.SLOTS + trainee.replay.CACHE:
+            np.save(os.path.join(temporary, "replay_" + name + ".npy"), getattr(trainee.replay, name))
+        manifest["replay"] = {"size": trainee.replay.size, "filled": trainee.replay.filled, "position": trainee.replay.position, "pending": trainee.replay.pending, "cache": True}
+    if trainee.trajectory is not None:
+        trainee.trajectory.flush()
+        manifest["trajectory"] = trainee.trajectory.records
+    if isinstance(engine, LockstepGames):
+        for name in engine.SLOTS:
+            np.save(os.path.join(temporary, name + ".npy"), getattr(engine, name))
+        manifest["lockstep"] = {
+            "kind": type(engine).__name__,
+            "size": engine.size,
+            "players": getattr(engine, "players", 2),
+            "rng": engine.rng.bit_generator.state,
+            "opponents": [describe(o, trainee, loopers, randomer, snapshots) for o in engine.opponents]
+        }
+    with open(os.path.join(temporary, "manifest.json"), "w") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    # 先写到临时文件夹再替换，保存到一半被打断时旧的检查点仍然完整
+    if os.path.exists(path):
+        shutil.rmtree(path + ".old", ignore_errors=True)
+        os.rename(path, path + ".old")
+    os.rename(temporary, path)
+    shutil.rmtree(path + ".old", ignore_errors=True)
+
+
+def load(path, trainee):  # 恢复 Q 表、计数、超参数和测试数据，返回的状态交给 restore
+    with open(os.path.join(path, "manifest.json"), "r") as f:
+        manifest = json.load(f)
+    if manifest["version"] != VERSION:
+        raise ValueError(f"Unsupported checkpoint version {manifest['version']}")
+    trainee.Q_table.reward = np.load(os.path.join(path, "reward.npy"))
+    trainee.Q_table.episode = np.load(os.path.join(path, "episode.npy"))
+    trainee.Q_table.invalidate()
+    trainee.HYPERPARAMETER_DICT = manifest["HYPERPARAMETER_DICT"]
+    trainee.game_round, trainee.total_round = manifest["game_round"], manifest["total_round"]
+    trainee.test_data = manifest["test_data"]
+    manifest["path"] = path
+    return manifest
+
+
+def restore(manifest, trainee, engine, loopers, randomer):  # 恢复历史池、同步推进的对局和随机状态，返回 (历史池, 下一次测试的轮数)
+    snapshots = []
+    if len(manifest["snapshots"]) > 0:
+        rewards = np.load(os.path.join(manifest["path"], "snapshots.npy"), mmap_mode="r")
+        snapshots = [train.FrozenPolicy(trainee.Q_table.actions, rewards[i], t, t_test) for i, (t, t_test) in enumerate(manifest["snapshots"])]
+    history = snapshots[:manifest["history"]]
+    lockstep = manifest["lockstep"]
+    if isinstance(engine, LockstepGames):
+        engine.history = history
+        if lockstep is not None and (lockstep.get("kind", "LockstepGames"), lockstep["size"], lockstep.get("players", 2)) == (type(engine).__name__, engine.size, getattr(engine, "players", 2)):  # BATCH_SIZE 或人数改变时所有对局重新开始
+            engine.opponents, engine.opponent_index = [], {}
+            for description in lockstep["opponents"]:
+                engine.register(resolve(description, trainee, loopers, randomer, snapshots))
+            for name in engine.SLOTS:
+                setattr(engine, name, np.load(os.path.join(manifest["path"], name + ".npy")))
+            engine.rng.bit_generator.state = lockstep["rng"]
+    replay = manifest.get("replay")
+    if trainee.replay is not None and replay is not None and replay["size"] == trainee.replay.size:  # REPLAY_SIZE 改变时缓冲区重新开始
+        for name in trainee.replay.SLOTS:
+            setattr(trainee.replay, name, np.load(os.path.join(manifest["path"], "replay_" + name + ".npy")))
+        trainee.replay.filled, trainee.replay.position, trainee.replay.pending = replay["filled"], replay["position"], replay["pending"]
+        if replay.get("cache", False):
+            for name in trainee.replay.CACHE:
+                setattr(trainee.replay, name, np.load(os.path.join(manifest["path"], "replay_" + name + ".npy")))
+        else:  # 旧的检查点没有保存缓存
+            trainee.replay.reset()
+    if manifest.get("map") is not None:
+        strategy_map.truncate_frames(trainee.map_path, manifest["map"])
+    version, state, gauss = manifest["random_state"]
+    random.setstate((version, tuple(state), gauss))
+    return history, manifest["next_test"]
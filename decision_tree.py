@@ -1,34 +1,82 @@
-from random import randint
+import os
 import sys
+import hashlib
 import joblib
+import numpy as np
 from sklearn.tree import DecisionTreeClassifier, export_text
-import statistics
+from q_table import QTable
+from rules import MOVEMENT_TABLE
+from state_space import OBSERVE, VALID_RAW, RAW_COUNT, RAW_COMBO, encode_raw
 
-def data_prepare(path):
-    table = joblib.load(path)
+CACHE_PATH = os.path.join("cache", "decision_tree")
+CACHE_VERSION = 1  # 数据集的构建方式改变时加一，旧的缓存自动失效
+
+
+def expand():  # 对方状态在 Q 表中是模糊的，把每个模糊的状态展开成它包含的所有真实状态，每个 Q 表状态的权重之和为 1
+    own, opponent = np.repeat(VALID_RAW, len(VALID_RAW)), np.tile(VALID_RAW, len(VALID_RAW))
+    state_ids = OBSERVE[own, opponent]
+    weight = 1.0 / np.bincount(state_ids)[state_ids]
+    features = np.stack([RAW_COUNT[own], RAW_COMBO[own], RAW_COUNT[opponent], RAW_COMBO[opponent]], axis=1)
+    return features, state_ids, weight
+
+
+def build_dataset(q_table):  # 向量化地构建所有动作的数据集
+    # 每个状态的奖励先减去平均值，再除以最大值，归一化后不小于 0.9 的动作为可选动作；所有动作奖励相同时都可选
+    legal = q_table.legal
+    reward = np.where(legal, q_table.reward, 0.0)
+    count = np.maximum(legal.sum(axis=1, keepdims=True), 1)
+    centered = reward - reward.sum(axis=1, keepdims=True) / count
+    maximum = np.where(legal, centered, -np.inf).max(axis=1, keepdims=True)
+    equal = np.where(legal, q_table.reward, -np.inf).max(axis=1) == np.where(legal, q_table.reward, np.inf).min(axis=1)
+    usable = equal[:, None] | (centered >= 0.9 * np.where(equal[:, None], 1.0, maximum))
+    features, state_ids, weight = expand()
+    return features, state_ids, weight, usable & legal, legal
+
+
+def data_prepare(path, use_cache=True, visits=None):  # 返回 {动作: (特征, 是否可选, 样本权重)}，按 Q 表文件的哈希缓存
+    # visits 为 trajectory.visits 统计的真实状态出现次数，指定时样本权重为出现次数，没有出现过的状态不参与建树
+    with open(path, "rb") as f:
+        key = hashlib.sha1(f.read()).hexdigest()
+    cache = os.path.join(CACHE_PATH, f"{key}_{CACHE_VERSION}.npz")
+    if use_cache and os.path.exists(cache):
+        data = np.load(cache)
+        actions = list(data["actions"])
+        features, state_ids, weight, usable, legal = data["features"], data["state_ids"], data["weight"], data["usable"], data["legal"]
+    else:
+        q_table = QTable.from_dict(joblib.load(path), MOVEMENT_TABLE)
+        actions = q_table.actions
+        features, state_ids, weight, usable, legal = build_dataset(q_table)
+        if use_cache:
+            os.makedirs(CACHE_PATH, exist_ok=True)
+            np.savez(cache, actions=np.array(actions), features=features, state_ids=state_ids, weight=weight, usable=usable, legal=legal)
+    if visits is not None:
+        weight = visits[encode_raw((features[:, 0], features[:, 1])), encode_raw((features[:, 2], features[:, 3]))].astype(np.float64)
+    # 与原来一样按动作第一次合法的状态排序
+    order = sorted(range(len(actions)), key=lambda a: (int(np.argmax(legal[:, a])), a))
     usable_movements = {}
-    for kk in table.keys():
-        actions = table[kk]
-        actions = [(k, v["reward"]) for k, v in actions.items()]
-        rewards = [r for _, r in actions]
-        mean = statistics.mean(rewards)
-        rewards = [i - mean for i in rewards]
-        maximum = max(rewards)
-        if maximum == 0:
-            rewards = [1.0] * len(rewards)
-        else:
-            rewards = [i / maximum for i in rewards]
-        actions = [(k, nr) for (k, _), nr in zip(actions, rewards)]
-        for k, v in actions:
-            if k not in usable_movements:
-                usable_movements[k] = ([], [])
-            def unblur(x):
-                return randint([0, 1, 2, 3, 5, 7, 10, 13][x], [0, 1, 2, 4, 6, 9, 11, 15][x])
-            usable_movements[k][0].append([kk[0][0], kk[0][1], unblur(kk[1][0]), unblur(kk[1][1])])
-            usable_movements[k][1].append(int(v >= 0.9))
+    for a in order:
+        mask = legal[state_ids, a] & (weight > 0)
+        if mask.any():
+            usable_movements[str(actions[a])] = (features[mask], usable[state_ids[mask], a].astype(int), weight[mask])
     return usable_movements
 
-def generated_tree(usable_movements):
+
+def fit_tree(usable):
+    features, labels, weight = usable
+    # 样本是展开后的真实状态，叶子大小和类别平衡都要按样本权重计算（sklearn 的 min_samples_leaf 和 class_weight 按行数计算），每个 Q 表状态才只算一次
+    total = np.bincount(labels, weights=weight)
+    balance = weight.sum() / (np.count_nonzero(total) * np.where(total > 0, total, 1))  # 与 class_weight="balanced" 相同，但用加权的类别总数
+    model = DecisionTreeClassifier(criterion="gini", max_depth=4, random_state=42, min_weight_fraction_leaf=0.1)
+    return model.fit(features, labels, sample_weight=weight * balance[labels])
+
+
+def fit_trees(usable_movements, n_jobs=-1):  # 返回 {动作: 决策树}
+    # 建树时 sklearn 会释放 GIL，用线程并行即可，不需要复制数据到其它进程
+    models = joblib.Parallel(n_jobs=n_jobs, prefer="threads")(joblib.delayed(fit_tree)(usable) for usable in usable_movements.values())
+    return dict(zip(usable_movements.keys(), models))
+
+
+def generated_tree(usable_movements, n_jobs=-1):
     fullname = {
         "生": "生化",
         "防": "防御",
@@ -52,20 +100,22 @@ def generated_tree(usable_movements):
         "机": "机器人"
     }
     rules = {}
-    for movement, usable in usable_movements.items():
-        model = DecisionTreeClassifier(criterion="gini", max_depth=4, random_state=42, min_samples_leaf=0.1, class_weight="balanced")
-        model.fit(usable[0], usable[1])
-        rule = export_text(model, feature_names=["我的生化数量", "我的连续生化数量", "对方生化数量", "对方连续生化数量"], class_names=["可以出" + fullname[movement], "不出" + fullname[movement]])
-        rules[movement] = rule
+    for movement, model in fit_trees(usable_movements, n_jobs).items():
+        rules[movement] = export_text(model, feature_names=["我的生化数量", "我的连续生化数量", "对方生化数量", "对方连续生化数量"], class_names=["可以出" + fullname[movement], "不出" + fullname[movement]])
     return rules
 
-def main(arg):
-    rules = generated_tree(data_prepare(arg[0]))
+
+def main(arg):  # decision_tree.py Q 表路径 [并行数] [--trajectory 轨迹文件...]
+    visits = None
+    if "--trajectory" in arg:  # 用训练时实际出现的状态建树
+        import trajectory
+        visits = trajectory.visits(arg[arg.index("--trajectory") + 1:])
+        arg = arg[:arg.index("--trajectory")]
+    rules = generated_tree(data_prepare(arg[0], visits=visits), int(arg[1]) if len(arg) > 1 else -1)
     for rule in rules.values():
         print(rule)
         print()
 
 
-
 if __name__ == "__main__":
     main(sys.argv[1:])
@@ -0,0 +1,76 @@
+import numpy as np
+from state_space import COUNT_SIZE, COMBO_SIZE, OBSERVE, encode_raw
+
+
+class LockstepGames:  # 同时推进 size 局游戏，每一步批量选择动作、判定和更新 Q 表
+    SLOTS = ("state_a", "state_b", "steps", "opponent")  # 每局游戏的状态数组，保存检查点时用到
+
+    def __init__(self, trainee, history, loopers, randomer, size, rng):
+        self.trainee = trainee
+        self.history = history  # 与 train.main 中的历史池是同一个列表
+        self.loopers = loopers
+        self.randomer = randomer
+        self.size = size
+        self.rng = rng
+        self.opponents = []  # 出现过的对手，下标即 self.opponent 中的编号
+        self.opponent_index = {}
+        self.tables = np.arange(size)  # 轨迹中的桌号
+        self.allocate()
+        self.restart(np.arange(size))
+
+    def allocate(self):
+        self.state_a = np.zeros(self.size, dtype=np.int64)
+        self.state_b = np.zeros(self.size, dtype=np.int64)
+        self.steps = np.zeros(self.size, dtype=np.int64)
+        self.opponent = np.zeros(self.size, dtype=np.int64)
+
+    def register(self, opponent):
+        if id(opponent) not in self.opponent_index:
+            self.opponent_index[id(opponent)] = len(self.opponents)
+            self.opponents.append(opponent)
+        return self.opponent_index[id(opponent)]
+
+    def choose_opponents(self, n):  # 与 train.main 中选择对手的比例相同
+        r = self.rng.random(n)
+        chosen = []
+        for i in range(n):
+            if r[i] < 0.6 and len(self.history) > 0:
+                chosen.append(self.register(self.history[self.rng.integers(len(self.history))]))
+            elif r[i] < 0.8:
+                chosen.append(self.register(self.trainee))
+            elif r[i] < 0.95:
+                chosen.append(self.register(self.loopers[self.rng.integers(len(self.loopers))]))
+            else:
+                chosen.append(self.register(self.randomer))
+        return chosen
+
+    def restart(self, index):  # 重新开始 index 中的游戏
+        n = len(index)
+        count_a, count_b = self.rng.integers(0, COUNT_SIZE, n), self.rng.integers(0, COUNT_SIZE, n)
+        combo_a = self.rng.integers(0, np.minimum(count_a, COMBO_SIZE - 1) + 1)
+        combo_b = self.rng.integers(0, np.minimum(count_b, COMBO_SIZE - 1) + 1)
+        random_starts = self.rng.random(n) < 0.6
+        self.state_a[index] = np.where(random_starts, encode_raw((count_a, combo_a)), 0)
+        self.state_b[index] = np.where(random_starts, encode_raw((count_b, combo_b)), 0)
+        self.steps[index] = 0
+        self.opponent[index] = self.choose_opponents(n)
+
+    def step(self):  # 所有游戏前进一步，返回结束的游戏数
+        rules = self.trainee.rules
+        action_a = self.trainee.choose_actions(rules, self.state_a, self.state_b, self.rng)
+        action_b = np.empty(self.size, dtype=np.int64)
+        for opponent in np.unique(self.opponent):
+            index = np.flatnonzero(self.opponent == opponent)
+            action_b[index] = self.opponents[opponent].choose_actions(rules, self.state_b[index], self.state_a[index], self.rng)
+        ended, state_a, state_b, reward_a, _ = rules.judge(self.state_a, self.state_b, action_a, action_b)
+        self.trainee.update_q_table_batch(OBSERVE[self.state_a, self.state_b], OBSERVE[state_a, state_b], action_a, reward_a)
+        if self.trainee.trajectory is not None:
+            self.trainee.trajectory.extend(self.tables, self.steps, (ended != 0) | (self.steps >= 99), self.state_a, self.state_b, state_a, state_b, action_a, action_b, reward_a)
+        self.state_a, self.state_b = state_a, state_b
+        self.steps += 1
+        self.trainee.total_round += self.size
+
+        finished = np.flatnonzero((ended != 0) | (self.steps >= 100))
+        self.trainee.game_round += len(finished)
+        self.restart(finished)
+        return len(finished)
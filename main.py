@@ -1,12 +1,24 @@
 import sys
-import train
-import decision_tree
 
-if __name__ == "__main__":
+if __name__ == "__main__":  # 每个模式只导入自己需要的模块
     mode = sys.argv[1]
     if mode == "-t":
+        import train
         train.main(sys.argv[2:])
     elif mode == "-d":
+        import decision_tree
         decision_tree.main(sys.argv[2:])
+    elif mode == "-s":
+        import solver
+        solver.main(sys.argv[2:])
+    elif mode == "-b":
+        import benchmark
+        benchmark.main(sys.argv[2:])
+    elif mode == "-r":
+        import report
+        report.main(sys.argv[2:])
+    elif mode == "-p":
+        import sweep
+        sweep.main(sys.argv[2:])
     else:
-        pass
\ No newline at end of file
+        pass
@@ -0,0 +1,39 @@
+import numpy as np
+from state_space import RAW_SIZE, VALID_RAW, encode_raw as encode
+
+# 两个策略都固定时，整局游戏是 ((我的生化, 我的连续生化), (对方生化, 对方连续生化)) 上的有限马尔可夫链
+
+
+def transition_matrix(rules, policy_a, policy_b):  # 稀疏转移矩阵 (行, 列, 权重) 以及每个联合状态的胜负概率
+    size = len(VALID_RAW)
+    policy_a = policy_a[np.ix_(VALID_RAW, VALID_RAW)].reshape(size * size, -1)  # [联合状态, A 动作]
+    policy_b = policy_b[np.ix_(VALID_RAW, VALID_RAW)].transpose(1, 0, 2).reshape(size * size, -1)  # 转成 [联合状态, B 动作]
+    win = ((policy_a @ (rules.outcome == 1)) * policy_b).sum(axis=1)
+    loss = ((policy_a @ (rules.outcome == -1)) * policy_b).sum(axis=1)
+    # need 和 combo 相同的手势对自身状态的影响相同，先按影响分组再合并概率
+    effect, action_effect = np.unique(np.stack([rules.need, rules.combo], axis=1), axis=0, return_inverse=True)
+    group = np.eye(len(effect))[action_effect.ravel()]  # [动作, 分组]
+    representative = np.array([np.flatnonzero(action_effect.ravel() == e)[0] for e in range(len(effect))])
+    weight = ((policy_a[:, :, None] * group).transpose(0, 2, 1) @ (rules.outcome == 0)) @ (policy_b[:, :, None] * group)  # [联合状态, A 分组, B 分组]
+    row, effect_a, effect_b = np.nonzero(weight)
+    weight = weight[row, effect_a, effect_b]
+    position = np.full(RAW_SIZE, -1)
+    position[VALID_RAW] = np.arange(size)
+    next_a = position[rules.transition[VALID_RAW[row // size], representative[effect_a]]]
+    next_b = position[rules.transition[VALID_RAW[row % size], representative[effect_b]]]
+    return row, next_a * size + next_b, weight, win, loss
+
+
+def absorb(rules, policy_a, policy_b, state_a=(0, 0), state_b=(0, 0), max_round=100):  # 精确计算 A 的胜率、败率和超时率
+    row, col, weight, win, loss = transition_matrix(rules, policy_a, policy_b)
+    size = len(VALID_RAW)
+    distribution = np.zeros(size * size)
+    distribution[np.searchsorted(VALID_RAW, encode(state_a)) * size + np.searchsorted(VALID_RAW, encode(state_b))] = 1.0
+    win_rate, loss_rate = 0.0, 0.0
+    for _ in range(max_round):  # 如果回合数大于 100 就直接判定为输
+        win_rate += distribution @ win
+        loss_rate += distribution @ loss
+        distribution = np.bincount(col, weights=distribution[row] * weight, minlength=size * size)
+        if distribution.sum() < 1e-12:  # 剩余概率已经可以忽略
+            break
+    return win_rate, loss_rate, distribution.sum()
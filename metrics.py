@@ -0,0 +1,96 @@
+import os
+import io
+import json
+import time
+import pstats
+import cProfile
+from contextlib import contextmanager
+import numpy as np
+
+try:  # psutil 是可选的，没有时在 Linux 上读取 /proc
+    import psutil
+except ImportError:
+    psutil = None
+
+
+def rss():  # 当前进程的常驻内存（MiB），无法获取时为 None
+    if psutil is not None:
+        return psutil.Process().memory_info().rss / 2 ** 20
+    if os.path.exists("/proc/self/statm"):
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    return None
+
+
+class Metrics:  # 训练过程中的计时和统计，每次测试后追加一行到 JSONL 文件
+    def __init__(self, path, trainee, profile_games=None, append=False):
+        self.path = path
+        self.trainee = trainee
+        self.phases = {}  # 阶段名 -> 累计秒数
+        self.start = self.last_time = time.perf_counter()
+        self.last_game_round, self.last_total_round = trainee.game_round, trainee.total_round
+        self.last_reward = trainee.Q_table.reward.copy()
+        self.profile_games = profile_games  # [开始的游戏数, 结束的游戏数]
+        self.profiler = None
+        if not append:
+            open(path, "w").close()
+
+    @contextmanager
+    def phase(self, name):  # with metrics.phase("..."): 累计这一段代码的时间
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - start
+
+    def record(self):  # 计算上次记录以来的统计量，写入文件并返回给 tqdm 显示的摘要
+        trainee, now = self.trainee, time.perf_counter()
+        games, rounds, seconds = trainee.game_round - self.last_game_round, trainee.total_round - self.last_total_round, now - self.last_time
+        legal = trainee.Q_table.legal
+        q_delta = float(np.linalg.norm(trainee.Q_table.reward[legal] - self.last_reward[legal]))
+        record = {
+            "time": now - self.start,
+            "game_round": trainee.game_round,
+            "total_round": trainee.total_round,
+            "games_per_sec": games / seconds if seconds > 0 else None,
+            "steps_per_sec": rounds / seconds if seconds > 0 else None,
+            "game_length": rounds / games if games > 0 else None,
+            "q_delta": q_delta,  # 与上次记录相比，所有合法 Q 值变化的 2-范数
+            "rss": rss(),
+            "phases": dict(self.phases),
+            "test": {k: v[-1] for k, v in trainee.test_data.items() if len(v) > 0}
+        }
+        with open(self.path, "a") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.last_time, self.last_game_round, self.last_total_round = now, trainee.game_round, trainee.total_round
+        self.last_reward = trainee.Q_table.reward.copy()
+        postfix = {"dQ": f"{q_delta:.3g}"}
+        if games > 0:
+            postfix["games/s"] = f"{games / seconds:.0f}"
+            postfix["len"] = f"{rounds / games:.1f}"
+        if record["rss"] is not None:
+            postfix["rss"] = f"{record['rss']:.0f}M"
+        return postfix
+
+    def profile(self):  # 在 PROFILE_GAMES 指定的游戏区间内运行 cProfile，每步调用一次
+        if self.profile_games is None:
+            return
+        start, end = self.profile_games
+        if self.profiler is None and start <= self.trainee.game_round < end:
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        elif self.profiler is not None and self.trainee.game_round >= end:
+            self.close()
+
+    def close(self):  # 结束性能分析并保存结果：.prof 可以用 pstats 或 snakeviz 打开，.txt 为耗时最多的函数
+        if self.profiler is None:
+            return
+        self.profiler.disable()
+        prefix = os.path.splitext(self.path)[0]
+        self.profiler.dump_stats(prefix + ".prof")
+        report = io.StringIO()
+        pstats.Stats(self.profiler, stream=report).sort_stats("cumulative").print_stats(30)
+        with open(prefix + ".txt", "w") as f:
+            f.write(report.getvalue())
+        self.profiler, self.profile_games = None, None
+        print(f"Saved profile in files {prefix}.prof and {prefix}.txt")
@@ -0,0 +1,97 @@
+import numpy as np
+from state_space import COUNT_SIZE, COMBO_SIZE, OBSERVE, encode_raw
+from lockstep import LockstepGames
+
+# 多人游戏：上一回合存活的玩家的手势能击杀的所有存活玩家都会死，无论他自己这一回合有没有被击杀
+# 状态为 [桌, 座位] 的真实状态编号，0 号座位是训练的 Agent
+
+
+def resolve(rules, state, alive, action):  # 一个回合的判定，返回 (存活, 新状态, 每个玩家击杀的人数, 这一回合死亡)
+    killed = rules.kill[action[:, :, None], action[:, None, :]] & alive[:, :, None] & alive[:, None, :]  # killed[桌, i, j]：i 击杀 j
+    died = killed.any(axis=1)
+    survivor = alive & ~died
+    return survivor, np.where(survivor, rules.transition[state, action], state), killed.sum(axis=2), died
+
+
+def observe(state, alive):  # 每个玩家看到的对手：其它存活玩家中编号最大的，即生化最多的（相同时连续生化最多）
+    players = state.shape[1]
+    other = np.where(alive[:, None, :] & ~np.eye(players, dtype=bool), state[:, None, :], -1).max(axis=2)
+    return np.maximum(other, 0)
+
+
+def rewards(kills, died):  # 每击杀一人 +5，死亡 -5，什么都没发生 -0.2，与两人游戏的奖励一致
+    return np.where((kills == 0) & ~died, -0.2, 5.0 * kills - 5.0 * died)
+
+
+def random_states(rng, shape, random_starts):  # 与 LockstepGames.restart 相同的随机开局
+    count = rng.integers(0, COUNT_SIZE, shape)
+    combo = rng.integers(0, np.minimum(count, COMBO_SIZE - 1) + 1)
+    return np.where(random_starts, encode_raw((count, combo)), 0)
+
+
+class MultiplayerGames(LockstepGames):  # 同时推进 size 桌 players 人游戏，训练的 Agent 坐在 0 号座位，其它座位按比例选择对手
+    SLOTS = ("state", "alive", "steps", "opponent")
+
+    def __init__(self, trainee, history, loopers, randomer, size, players, rng):
+        self.players = players
+        super().__init__(trainee, history, loopers, randomer, size, rng)
+
+    def allocate(self):
+        self.state = np.zeros((self.size, self.players), dtype=np.int64)
+        self.alive = np.ones((self.size, self.players), dtype=bool)
+        self.steps = np.zeros(self.size, dtype=np.int64)
+        self.opponent = np.zeros((self.size, self.players - 1), dtype=np.int64)  # 1 号及以后座位的对手
+
+    def restart(self, index):
+        n = len(index)
+        self.state[index] = random_states(self.rng, (n, self.players), (self.rng.random(n) < 0.6)[:, None])
+        self.alive[index] = True
+        self.steps[index] = 0
+        self.opponent[index] = np.array(self.choose_opponents(n * (self.players - 1))).reshape(n, self.players - 1)
+
+    def step(self):
+        rules = self.trainee.rules
+        view = observe(self.state, self.alive)
+        action = np.empty(self.state.shape, dtype=np.int64)
+        action[:, 0] = self.trainee.choose_actions(rules, self.state[:, 0], view[:, 0], self.rng)
+        for opponent in np.unique(self.opponent):
+            table, seat = np.nonzero(self.opponent == opponent)
+            seat += 1
+            action[table, seat] = self.opponents[opponent].choose_actions(rules, self.state[table, seat], view[table, seat], self.rng)
+        alive, state, kills, died = resolve(rules, self.state, self.alive, action)
+        new_view = observe(state, alive)
+        reward = rewards(kills[:, 0], died[:, 0])
+        self.trainee.update_q_table_batch(OBSERVE[self.state[:, 0], view[:, 0]], OBSERVE[state[:, 0], new_view[:, 0]], action[:, 0], reward)
+        if self.trainee.trajectory is not None:  # 对手是看到的那个玩家，动作记为 255
+            done = ~alive[:, 0] | (alive.sum(axis=1) <= 1) | (self.steps >= 99)
+            self.trainee.trajectory.extend(self.tables, self.steps, done, self.state[:, 0], view[:, 0], state[:, 0], new_view[:, 0], action[:, 0], 255, reward)
+        self.state, self.alive = state, alive
+        self.steps += 1
+        self.trainee.total_round += self.size
+
+        # Agent 死亡、只剩不超过一人或回合数达到 100 时结束
+        finished = np.flatnonzero(~alive[:, 0] | (alive.sum(axis=1) <= 1) | (self.steps >= 100))
+        self.trainee.game_round += len(finished)
+        self.restart(finished)
+        return len(finished)
+
+
+def test(trainee, opponents, players, tag, games, rng):  # Agent 和固定的对手们（按座位轮流坐）按测试温度进行 games 局，记录胜率
+    seats = [opponents[(seat - 1) % len(opponents)] for seat in range(1, players)]
+    state = np.zeros((games, players), dtype=np.int64)
+    alive = np.ones((games, players), dtype=bool)
+    rules = trainee.rules
+    for _ in range(100):  # 如果回合数大于 100 就直接判定为输
+        running = np.flatnonzero(alive[:, 0] & (alive.sum(axis=1) > 1))
+        if len(running) == 0:
+            break
+        view = observe(state[running], alive[running])
+        action = np.empty((len(running), players), dtype=np.int64)
+        action[:, 0] = trainee.choose_actions(rules, state[running, 0], view[:, 0], rng, False)
+        for seat in range(1, players):
+            action[:, seat] = seats[seat - 1].choose_actions(rules, state[running, seat], view[:, seat], rng, False)
+        alive[running], state[running], _, _ = resolve(rules, state[running], alive[running], action)
+    win_rate = float((alive[:, 0] & (alive.sum(axis=1) == 1)).mean())  # 只有 Agent 存活才算胜
+    if tag not in trainee.test_data:
+        trainee.test_data[tag] = []
+    trainee.test_data[tag].append(win_rate)
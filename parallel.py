@@ -0,0 +1,110 @@
+import os
+import random
+import time
+import multiprocessing as mp
+from multiprocessing.shared_memory import SharedMemory
+import numpy as np
+import train
+import trajectory
+
+
+def attach(q_table, names):  # 让 Q 表的数组使用共享内存
+    memory = [SharedMemory(name=name) for name in names]
+    q_table.reward = np.ndarray(q_table.reward.shape, dtype=q_table.reward.dtype, buffer=memory[0].buf)
+    q_table.episode = np.ndarray(q_table.episode.shape, dtype=q_table.episode.dtype, buffer=memory[1].buf)
+    return memory
+
+
+def work(HYPERPARAMETER_DICT, names, index, seed, game_counter, round_counter, claimed, stop):  # 工作进程：不加锁地直接更新共享的 Q 表（Hogwild）
+    random.seed(int(seed.generate_state(1)[0]))
+    trainee = train.Agent()
+    trainee.HYPERPARAMETER_DICT = HYPERPARAMETER_DICT
+    memory = attach(trainee.Q_table, names)
+    randomer = train.Foolish(trainee.MOVEMENT_TABLE)
+    loopers = train.make_loopers()
+    history = []
+    batch = train.make_batch(trainee, history, loopers, randomer, np.random.default_rng(seed))
+    TOTAL_GAME_ROUND, COPY_PER_ROUND, SYNC_PER_ROUND = HYPERPARAMETER_DICT["TOTAL_GAME_ROUND"], HYPERPARAMETER_DICT["COPY_PER_ROUND"], HYPERPARAMETER_DICT.get("SYNC_PER_ROUND", 1000)
+    trainee.game_round, trainee.total_round = game_counter.value, round_counter.value
+    trainee.replay = train.make_replay(trainee)
+    if trainee.replay is not None:
+        trainee.replay.shared = True  # 其它进程也在修改 Q 表
+    if HYPERPARAMETER_DICT.get("TRAJECTORY_PATH") is not None:  # 每个进程写自己的轨迹文件，从检查点继续时接着写
+        path = f"{HYPERPARAMETER_DICT['TRAJECTORY_PATH']}.{index}"
+        trainee.trajectory = trajectory.TrajectoryWriter(path, trajectory.count(path) if trainee.game_round > 0 and os.path.exists(path) else None)
+    next_copy = trainee.game_round - trainee.game_round % COPY_PER_ROUND
+    try:
+        while not stop.is_set() and trainee.game_round < TOTAL_GAME_ROUND:
+            if trainee.game_round >= next_copy:
+                train.add_history(history, trainee)
+                next_copy = trainee.game_round - trainee.game_round % COPY_PER_ROUND + COPY_PER_ROUND
+            with claimed.get_lock():  # 先领取这次同步要玩的局数，所有进程领取的总数不超过 TOTAL_GAME_ROUND
+                window = min(SYNC_PER_ROUND, TOTAL_GAME_ROUND - claimed.value)
+                claimed.value += max(window, 0)
+            if window <= 0:
+                break
+            synced_game, synced_round = trainee.game_round, trainee.total_round
+            while not stop.is_set() and trainee.game_round - synced_game < window:
+                if batch is None:
+                    train.play_game(trainee, history, loopers, randomer)
+                else:
+                    batch.step()
+            # 同步游戏数，温度按所有进程的总游戏数计算
+            with game_counter.get_lock():
+                game_counter.value += trainee.game_round - synced_game
+                trainee.game_round = game_counter.value
+            with round_counter.get_lock():
+                round_counter.value += trainee.total_round - synced_round
+                trainee.total_round = round_counter.value
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if trainee.trajectory is not None:
+            trainee.trajectory.close()
+        trainee.Q_table.reward, trainee.Q_table.episode = None, None  # 先释放对共享内存的引用
+        for m in memory:
+            m.close()
+
+
+class ParallelTraining:  # 在主进程中管理工作进程，接口与 LockstepGames.step 相同
+    def __init__(self, trainee, WORKERS):
+        self.trainee = trainee
+        self.memory = [SharedMemory(create=True, size=array.nbytes) for array in (trainee.Q_table.reward, trainee.Q_table.episode)]
+        reward = np.ndarray(trainee.Q_table.reward.shape, dtype=trainee.Q_table.reward.dtype, buffer=self.memory[0].buf)
+        episode = np.ndarray(trainee.Q_table.episode.shape, dtype=trainee.Q_table.episode.dtype, buffer=self.memory[1].buf)
+        reward[:], episode[:] = trainee.Q_table.reward, trainee.Q_table.episode
+        trainee.Q_table.reward, trainee.Q_table.episode = reward, episode
+        self.game_counter = mp.Value("q", trainee.game_round)
+        self.round_counter = mp.Value("q", trainee.total_round)
+        self.claimed = mp.Value("q", trainee.game_round)  # 已经分给工作进程的局数
+        self.stop = mp.Event()
+        seeds = np.random.SeedSequence([trainee.HYPERPARAMETER_DICT.get("SEED", 42), trainee.game_round]).spawn(WORKERS)  # 每个进程的随机种子都是确定的，从检查点继续时换一组
+        self.workers = [
+            mp.Process(target=work, args=(trainee.HYPERPARAMETER_DICT, [m.name for m in self.memory], i, seeds[i], self.game_counter, self.round_counter, self.claimed, self.stop), daemon=True)
+            for i in range(WORKERS)
+        ]
+        for worker in self.workers:
+            worker.start()
+        self.closed = False
+
+    def step(self):  # 等待一会儿，返回这段时间内完成的游戏数
+        time.sleep(0.1)
+        if any(worker.exitcode not in (None, 0) for worker in self.workers):
+            raise RuntimeError("A training worker exited unexpectedly")
+        self.trainee.Q_table.invalidate()  # Q 表由工作进程更新，主进程的抽样缓存全部失效
+        finished = self.game_counter.value - self.trainee.game_round
+        self.trainee.game_round, self.trainee.total_round = self.game_counter.value, self.round_counter.value
+        return finished
+
+    def close(self):  # 停止工作进程，把 Q 表复制回普通内存并释放共享内存
+        if self.closed:
+            return
+        self.closed = True
+        self.stop.set()
+        for worker in self.workers:
+            worker.join()
+        self.trainee.Q_table.reward = np.array(self.trainee.Q_table.reward)
+        self.trainee.Q_table.episode = np.array(self.trainee.Q_table.episode)
+        for m in self.memory:
+            m.close()
+            m.unlink()
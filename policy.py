@@ -0,0 +1,53 @@
+import os
+import json
+import numpy as np
+from q_table import QTable, softmax
+from rules import MOVEMENT_TABLE
+from state_space import STATE_SHAPE
+
+# 编译好的策略：<前缀>.npy 为 float32 数组 [Q 表状态编号, 2, 动作]，[:, 0] 是概率，[:, 1] 是 Q 值（非法动作为 -inf）
+# <前缀>.json 保存动作名称、温度和来源，查询时用 mmap_mode 映射 .npy，不需要读取整个文件；状态编号见 state_space.encode_states
+VERSION = 1
+
+
+def compile_q_table(q_table, t):  # softmax 策略在温度 t 下的概率
+    return np.stack([softmax(q_table.reward, t), q_table.reward], axis=1).astype(np.float32)
+
+
+def compile_tree(path, n_jobs=-1):  # 决策树的策略：在树判断为可选的动作中均匀随机，没有可选动作时在所有合法动作中均匀随机
+    import decision_tree  # 需要 sklearn
+    models = decision_tree.fit_trees(decision_tree.data_prepare(path), n_jobs)
+    q_table = QTable(MOVEMENT_TABLE)
+    features, state_ids, weight = decision_tree.expand()
+    score = np.zeros(q_table.reward.shape)  # 展开后的真实状态中被判断为可选的比例
+    for movement, model in models.items():
+        if 1 in model.classes_:
+            usable = model.predict_proba(features)[:, list(model.classes_).index(1)]
+            score[:, q_table.action_id[movement]] = np.bincount(state_ids, weights=weight * usable, minlength=len(score))
+    usable = q_table.legal & (score >= 0.5)
+    usable = np.where(usable.any(axis=1, keepdims=True), usable, q_table.legal)
+    count = usable.sum(axis=1, keepdims=True)
+    probability = np.divide(usable, count, out=np.zeros(usable.shape), where=count > 0)
+    return np.stack([probability, np.where(q_table.legal, score, -np.inf)], axis=1).astype(np.float32)
+
+
+def save(prefix, table, actions, meta):
+    os.makedirs(os.path.dirname(prefix) or ".", exist_ok=True)
+    np.save(prefix + ".npy", table)
+    with open(prefix + ".json", "w") as f:
+        json.dump({"version": VERSION, "actions": actions, "state_shape": STATE_SHAPE, **meta}, f, ensure_ascii=False, indent=2)
+
+
+def load(prefix):  # 返回 (映射的数组, 说明)
+    with open(prefix + ".json", "r") as f:
+        meta = json.load(f)
+    if meta["version"] != VERSION:
+        raise ValueError(f"Unsupported policy version {meta['version']}")
+    return np.load(prefix + ".npy", mmap_mode="r"), meta
+
+
+def query(table, ids):  # 返回 (最优动作编号, 概率, 第二列)，第二列对 Q 表为 Q 值，对决策树为判断为可选的比例；非法状态的行全为 0
+    rows = np.asarray(table[np.maximum(ids, 0)], dtype=np.float32)
+    rows[ids < 0] = 0
+    probability, value = rows[:, 0], rows[:, 1]
+    return probability.argmax(axis=1), probability, value
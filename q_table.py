@@ -0,0 +1,115 @@
+import math
+import bisect
+import random
+import itertools
+import numpy as np
+from state_space import STATE_SIZE, VALID, encode, decode, legal_states  # Q 表状态的编码见 state_space
+
+
+def softmax(rewards, t):  # 最后一维为动作，非法动作（-inf）的概率为 0
+    maximum = rewards.max(axis=-1, keepdims=True)
+    weight = np.exp((rewards - np.where(np.isfinite(maximum), maximum, 0)) / t)
+    total = weight.sum(axis=-1, keepdims=True)
+    return np.divide(weight, total, out=np.zeros_like(weight), where=total > 0)
+
+
+def choose(rewards, legal, t):  # 按 softmax 概率选择一个动作，rewards 为一行 Q 值的列表，legal 为合法动作编号的列表，返回动作编号
+    # 逐局训练时每次只选一个动作，只有十几个合法动作，用 Python 标量计算比调用 NumPy 快得多
+    maximum = max([rewards[a] for a in legal])
+    weighted_range = list(itertools.accumulate([math.exp((rewards[a] - maximum) / t) for a in legal]))
+    rand = random.random() * weighted_range[-1]
+    return legal[min(bisect.bisect_right(weighted_range, rand), len(legal) - 1)]
+
+
+def sample(probability, rng):  # 每一行按概率抽取一个动作
+    cumulative = probability.cumsum(axis=-1)
+    rand = rng.random(cumulative.shape[:-1]) * cumulative[..., -1]
+    return np.minimum((cumulative <= rand[..., None]).sum(axis=-1), probability.shape[-1] - 1)
+
+
+class AliasCache:  # 温度固定时各状态的 alias 表，按需构建，之后每次抽样都是 O(1)
+    def __init__(self, owner, t):
+        self.owner = owner  # 读取 owner.reward，Q 表或策略快照
+        self.t = t
+        self.ready = np.zeros(len(owner.reward), dtype=bool)
+        self.threshold = None
+        self.alias = None
+
+    def build(self, state_ids):  # 用 square histogram 方法同时构建多个状态的 alias 表
+        if self.threshold is None:
+            self.threshold = np.ones(self.owner.reward.shape, dtype=np.float32)
+            self.alias = np.zeros(self.owner.reward.shape, dtype=np.int8)
+        n = self.owner.reward.shape[1]
+        scaled = softmax(self.owner.reward[state_ids], self.t) * n  # 平均值为 1
+        threshold, alias = np.ones(scaled.shape), np.tile(np.arange(n), (len(scaled), 1))
+        done = np.zeros(scaled.shape, dtype=bool)
+        rows = np.arange(len(scaled))
+        for _ in range(n - 1):  # 每次用剩下最大的一格填满最小的一格
+            small = np.where(done, np.inf, scaled).argmin(axis=1)
+            large = np.where(done, -np.inf, scaled).argmax(axis=1)
+            threshold[rows, small] = scaled[rows, small]
+            alias[rows, small] = large
+            scaled[rows, large] -= 1 - scaled[rows, small]
+            done[rows, small] = True
+        self.threshold[state_ids], self.alias[state_ids] = threshold, alias
+        self.ready[state_ids] = True
+
+    def draw(self, state_id):  # 抽取一个动作编号
+        if not self.ready.item(state_id):
+            self.build([state_id])
+        rand = random.random() * self.threshold.shape[1]
+        slot = int(rand)
+        return slot if rand - slot < self.threshold.item(state_id, slot) else self.alias.item(state_id, slot)  # item 比 NumPy 标量索引快
+
+    def draws(self, state_ids, rng):  # 批量抽取
+        if not self.ready[state_ids].all():  # 批量抽样时一次性构建所有未就绪的状态，避免反复小批量构建
+            self.build(np.flatnonzero(~self.ready))
+        rand = rng.random(len(state_ids)) * self.threshold.shape[1]
+        slot = rand.astype(np.int64)
+        return np.where(rand - slot < self.threshold[state_ids, slot], slot, self.alias[state_ids, slot])
+
+
+class QTable:
+    def __init__(self, MOVEMENT_TABLE):
+        self.actions = list(MOVEMENT_TABLE.keys())
+        self.action_id = {a: n for n, a in enumerate(self.actions)}
+        need = np.array([MOVEMENT_TABLE[a]["need"] for a in self.actions])
+        combo = np.array([MOVEMENT_TABLE[a]["combo"] for a in self.actions])
+        self.valid = VALID  # 合法状态
+        self.legal = legal_states(need, combo)  # 合法动作
+        self.legal_list = [np.flatnonzero(row).tolist() for row in self.legal]  # 每个状态的合法动作编号，逐个选择动作时用
+        self.reward = np.where(self.legal, 0.0, -np.inf)  # 非法动作的奖励为 -inf，取 max 和 softmax 时自动被排除
+        self.episode = np.zeros((STATE_SIZE, len(self.actions)), dtype=np.int64)
+        self.caches = {}  # 温度 -> AliasCache
+
+    def alias(self, t):  # 温度 t 下的抽样缓存
+        if t not in self.caches:
+            self.caches[t] = AliasCache(self, t)
+        return self.caches[t]
+
+    def invalidate(self, state_ids=slice(None)):  # Q 值改变后让对应状态的缓存失效
+        for cache in self.caches.values():
+            cache.ready[state_ids] = False
+
+    def __len__(self):
+        return int(self.valid.sum())
+
+    def to_dict(self):  # 转换为旧的 joblib 格式
+        table = {}
+        for state_id in np.flatnonzero(self.valid):
+            table[decode(state_id)] = {
+                self.actions[a]: {"reward": float(self.reward[state_id, a]), "episode": int(self.episode[state_id, a])}
+                for a in np.flatnonzero(self.legal[state_id])
+            }
+        return table
+
+    @classmethod
+    def from_dict(cls, table, MOVEMENT_TABLE):  # 从旧的 joblib 格式加载
+        q_table = cls(MOVEMENT_TABLE)
+        for state, movements in table.items():
+            state_id = encode(state)
+            for movement, v in movements.items():
+                a = q_table.action_id[movement]
+                q_table.reward[state_id, a] = v["reward"]
+                q_table.episode[state_id, a] = v["episode"]
+        return q_table
@@ -0,0 +1,119 @@
+import numpy as np
+from state_space import STATE_SIZE
+
+
+class PrioritizedReplay:  # 用最近的真实转移作为经验模型，按 TD 误差从大到小对 (状态, 动作) 做期望更新（prioritized sweeping）
+    # 对手的动作是随机的，反复重放单个转移会让 Q 值偏向这个转移的结果，所以重放时用缓冲区中同一 (状态, 动作) 所有转移的平均目标
+    # 目标和优先级按增量维护：某个状态的 max Q 改变后，只通过前驱索引更新以它为下一状态的转移所在的 (状态, 动作)
+    SLOTS = ("key", "new_id", "reward")  # 保存检查点时用到
+    CACHE = ("value", "count", "total", "priority", "dirty", "stale", "order", "offsets", "recent")  # 增量维护的缓存，浮点数的累加与更新的先后有关，也保存在检查点中
+
+    def __init__(self, trainee, size, updates, batch, threshold):
+        self.trainee = trainee
+        self.size = size  # 最多保存的转移数，满了之后覆盖最早的
+        self.updates = updates  # 每个真实转移对应的重放次数，可以是小数
+        self.batch = batch  # 每次重放的 (状态, 动作) 数
+        self.threshold = threshold  # 优先级不超过它的 (状态, 动作) 不重放
+        self.actions = trainee.Q_table.reward.shape[1]
+        self.key = np.zeros(size, dtype=np.int64)  # 状态编号 * 动作数 + 动作编号
+        self.new_id = np.zeros(size, dtype=np.int64)
+        self.reward = np.zeros(size)
+        self.filled = 0
+        self.position = 0
+        self.pending = 0.0  # 还没有用掉的重放次数
+        self.rows = []  # 逐局训练时先攒下一局的转移
+        self.shared = False  # 多进程训练时 Q 表也会被其它进程修改，每次重放前检查所有状态
+        self.reset()
+
+    def reset(self):  # 由缓冲区和当前的 Q 表重新计算所有缓存，载入没有缓存的检查点时使用
+        key, size = self.key[:self.filled], STATE_SIZE * self.actions
+        self.value = self.trainee.Q_table.reward.max(axis=1)  # 每个状态计入 total 的 max Q
+        self.count = np.bincount(key, minlength=size)  # 每个 (状态, 动作) 的转移数
+        self.total = np.bincount(key, weights=self.reward[:self.filled] + self.trainee.HYPERPARAMETER_DICT["GAMMA"] * self.value[self.new_id[:self.filled]], minlength=size).astype(np.float64)  # 缓冲区为空时 bincount 返回整数；所有转移的 r + GAMMA * value[s'] 之和
+        self.priority = np.zeros(size)  # 平均目标与 Q 值之差的绝对值
+        self.dirty = np.zeros(STATE_SIZE, dtype=bool)  # Q 值可能改变了、value 需要重新计算的状态
+        self.stale = self.count > 0  # 优先级需要重新计算的 (状态, 动作)
+        self.index()
+
+    def index(self):  # 重建前驱索引：按下一状态排序的转移位置，之后写入的位置记在 recent 中，查找时直接扫描
+        self.order = np.argsort(self.new_id[:self.filled], kind="stable")
+        self.offsets = np.r_[0, np.bincount(self.new_id[:self.filled], minlength=STATE_SIZE).cumsum()]
+        self.recent = np.zeros(self.size, dtype=bool)
+
+    def predecessors(self, states):  # 下一状态在 states 中的转移位置
+        start, length = self.offsets[states], self.offsets[states + 1] - self.offsets[states]
+        slots = self.order[np.arange(length.sum()) - np.repeat(length.cumsum() - length - start, length)]
+        slots = slots[~self.recent[slots]]  # 建索引之后被覆盖的位置以 recent 中的为准
+        count = np.count_nonzero(self.recent)  # 建索引之后按顺序写入，就是 position 之前的 count 个位置
+        recent = (self.position - count + np.arange(count)) % self.size
+        inside = np.zeros(STATE_SIZE, dtype=bool)
+        inside[states] = True
+        return np.concatenate([slots, recent[inside[self.new_id[recent]]]])
+
+    def add(self, old_ids, new_ids, actions, rewards):  # 加入一批已经用来更新过 Q 表的真实转移，然后按预算重放
+        GAMMA = self.trainee.HYPERPARAMETER_DICT["GAMMA"]
+        n = min(len(old_ids), self.size)
+        index = (self.position + np.arange(n)) % self.size
+        old = index[index < self.filled]  # 被覆盖的转移
+        np.subtract.at(self.total, self.key[old], self.reward[old] + GAMMA * self.value[self.new_id[old]])
+        np.subtract.at(self.count, self.key[old], 1)
+        emptied = self.key[old][self.count[self.key[old]] == 0]
+        self.total[emptied], self.stale[self.key[old]] = 0.0, True  # 没有转移的 (状态, 动作) 清零，避免累积舍入误差
+        keys = old_ids * self.actions + actions
+        self.key[index], self.new_id[index], self.reward[index] = keys[-n:], new_ids[-n:], rewards[-n:]
+        np.add.at(self.total, keys[-n:], rewards[-n:] + GAMMA * self.value[new_ids[-n:]])
+        np.add.at(self.count, keys[-n:], 1)
+        self.dirty[old_ids], self.stale[keys] = True, True  # 真实更新改变了这些 (状态, 动作) 的 Q 值
+        self.recent[index] = True
+        self.position = (self.position + n) % self.size
+        self.filled = min(self.filled + n, self.size)
+        self.pending += self.updates * len(old_ids)
+        while self.pending >= self.batch:
+            self.replay()
+            self.pending -= self.batch
+
+    def record(self, old_id, new_id, action, reward):  # 逐局训练时的一个转移
+        self.rows.append((old_id, new_id, action, reward))
+
+    def flush(self):  # 一局结束时把这一局的转移一起加入
+        if len(self.rows) > 0:
+            old_ids, new_ids, actions, rewards = map(np.array, zip(*self.rows))
+            self.rows = []
+            self.add(old_ids, new_ids, actions, rewards.astype(np.float64))
+
+    def refresh(self):  # 把 Q 值改变了的状态的新 max Q 传给它的前驱，再重新计算受影响的 (状态, 动作) 的优先级
+        if np.count_nonzero(self.recent) * 8 > self.size:  # 直接扫描的位置太多时重建索引
+            self.index()
+        states = np.arange(STATE_SIZE) if self.shared else np.flatnonzero(self.dirty)
+        self.dirty[:] = False
+        value = self.trainee.Q_table.reward[states].max(axis=1)
+        changed = value != self.value[states]
+        states, delta = states[changed], value[changed] - self.value[states[changed]]
+        if len(states) > 0:
+            step = np.zeros(STATE_SIZE)
+            step[states] = self.trainee.HYPERPARAMETER_DICT["GAMMA"] * delta
+            slots = self.predecessors(states)
+            np.add.at(self.total, self.key[slots], step[self.new_id[slots]])
+            self.stale[self.key[slots]] = True
+            self.value[states] = value[changed]
+        if self.shared:
+            self.stale |= self.count > 0
+        keys = np.flatnonzero(self.stale)
+        self.stale[keys] = False
+        count = self.count[keys]
+        target = self.total[keys] / np.maximum(count, 1)
+        self.priority[keys] = np.where(count > 0, np.abs(target - self.trainee.Q_table.reward.reshape(-1)[keys]), 0.0)
+
+    def replay(self):
+        self.refresh()
+        keys = np.flatnonzero(self.priority > self.threshold)  # 优先级不超过阈值的不重放
+        if len(keys) > self.batch:
+            keys = keys[np.argpartition(self.priority[keys], -self.batch)[-self.batch:]]  # 优先级最高的 batch 个 (状态, 动作)
+        if len(keys) == 0:
+            return
+        target = self.total[keys] / self.count[keys]
+        reward, episode = self.trainee.Q_table.reward.reshape(-1), self.trainee.Q_table.episode.reshape(-1)
+        alpha = self.trainee.get_alphas(episode[keys])  # 重放不算新的经验，使用当前的学习率
+        reward[keys] = np.clip(reward[keys] + alpha * (target - reward[keys]), -15, 15)  # 限制奖励范围
+        self.dirty[keys // self.actions], self.stale[keys] = True, True
+        self.trainee.Q_table.invalidate(keys // self.actions)
@@ -0,0 +1,49 @@
+import os
+import sys
+import json
+import time
+import statistics
+
+# 训练结束后根据 test_data.json 和 map.frames 画胜率图、渲染策略图，训练本身不需要 matplotlib 和 PIL
+
+
+def plot_win_rate(test_data, SMOOTHNESS, path, show=False):
+    import matplotlib
+    if not show:
+        matplotlib.use("Agg")  # 不需要显示窗口，在没有图形界面的机器上也能运行
+    import matplotlib.pyplot as plt
+    for k, v in test_data.items():
+        smooth_data = [statistics.mean(v[i: i + SMOOTHNESS]) for i in range(len(v) - SMOOTHNESS)]
+        plt.plot(list(range(len(v) - SMOOTHNESS)), smooth_data, label=k, linewidth=1, linestyle="-", marker="o")
+    plt.title("Win Rate", fontsize=14, fontweight="bold")
+    plt.xlabel("Time", fontsize=12)
+    plt.ylabel("Win Rate", fontsize=12)
+    plt.legend(loc="upper left")
+    plt.grid(True, alpha=0.3)
+    plt.ylim(0, 1)
+    plt.tight_layout()
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    plt.savefig(path, dpi=300)
+    print(f"Saved win rate plot in file {path}")
+    if show:
+        plt.show()
+    plt.close()
+
+
+def main(args):  # report.py [test_data.json] [map.frames] [--show]
+    show = "--show" in args
+    args = [a for a in args if a != "--show"]
+    test_data_path = args[0] if len(args) > 0 else "test_data.json"
+    frames_path = args[1] if len(args) > 1 else "map.frames"
+    with open(test_data_path, "r") as f:
+        data = json.load(f)
+    plot_win_rate(data["test_data"], data["HYPERPARAMETER_DICT"]["SMOOTHNESS"], os.path.join("winrate", f"win_rate_{time.strftime('%Y-%m-%d_%H-%M-%S', time.localtime())}.png"), show)
+    if os.path.exists(frames_path):
+        import strategy_map
+        path = strategy_map.render(frames_path, os.path.join(os.path.dirname(frames_path), "map.webp"))
+        if path is not None:
+            print(f"Saved strategy map in file {path}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,60 @@
+import numpy as np
+from state_space import COUNT_SIZE, COMBO_SIZE, RAW_COUNT, RAW_COMBO, legal_raw  # 状态的编码见 state_space
+
+
+# 拍手游戏的规则：每个手势能击杀的手势、需要的生化数量（负数表示增加）和连续生化数量
+MOVEMENT_TABLE = {
+    "生": {"kill": {"零"}, "need": -1, "combo": 0},
+    "防": {"kill": set(), "need": 0, "combo": 0},
+    "飞": {"kill": set(), "need": 0, "combo": 0},
+    "单": {"kill": {"生", "地"}, "need": 1, "combo": 0},
+    "双": {"kill": {"生", "一", "地"}, "need": 2, "combo": 0},
+    "弯": {"kill": {"单", "双", "镖", "地", "机"}, "need": 1, "combo": 0},
+    "刺": {"kill": {"弯", "肥", "地"}, "need": 1, "combo": 0},
+    "肥": {"kill": {"防", "飞", "弯"}, "need": 5, "combo": 0},
+    "镖": {"kill": {"飞"}, "need": 3, "combo": 0},
+    "零": {"kill": {"防"}, "need": 0, "combo": 0},
+    "一": {"kill": set(), "need": -1, "combo": 1},
+    "二": {"kill": set(), "need": -2, "combo": 2},
+    "三": {"kill": set(), "need": -3, "combo": 3},
+    "四": {"kill": set(), "need": -4, "combo": 4},
+    "五": {"kill": set(), "need": -5, "combo": 5},
+    "胡": {"kill": {"生", "厨"}, "need": 1, "combo": 0},
+    "菜": {"kill": {"胡"}, "need": 1, "combo": 0},
+    "厨": {"kill": {"菜"}, "need": 2, "combo": 0},
+    "地": {"kill": {"生", "一", "二", "三", "四", "五"}, "need": 3, "combo": 0},
+    "机": {"kill": {"生", "防", "飞", "单", "双", "刺", "肥", "镖", "一", "二", "三", "四", "五", "胡", "菜", "厨", "地"}, "need": 10, "combo": 0}
+}
+
+
+class Rules:  # 把 MOVEMENT_TABLE 编译成整数表
+    def __init__(self, MOVEMENT_TABLE):
+        self.actions = list(MOVEMENT_TABLE.keys())
+        self.action_id = {a: n for n, a in enumerate(self.actions)}
+        self.need = np.array([MOVEMENT_TABLE[a]["need"] for a in self.actions])
+        self.combo = np.array([MOVEMENT_TABLE[a]["combo"] for a in self.actions])
+        # kill[a, b]：手势 a 能击杀手势 b
+        self.kill = np.array([[b in MOVEMENT_TABLE[a]["kill"] for b in self.actions] for a in self.actions])
+        # outcome[a, b]：1 表示 A 胜，-1 表示 B 胜，0 表示继续；双方互相克制时算 A 胜
+        self.outcome = np.where(self.kill, 1, np.where(self.kill.T, -1, 0))
+        self.reward_a = np.where(self.outcome == 0, -0.2, 5.0 * self.outcome)
+        self.reward_b = np.where(self.outcome == 0, -0.2, -5.0 * self.outcome)
+
+        count, combo = RAW_COUNT[:, None], RAW_COMBO[:, None]
+        self.legal = legal_raw(self.need, self.combo)  # legal[状态, 动作]
+        # 技能和攻击清空连续生化，生化使连续生化加一，防御类不变
+        new_combo = np.where((self.combo != 0) | (self.need > 0), 0, np.where(self.need != 0, np.minimum(combo + 1, COMBO_SIZE - 1), combo))
+        new_count = np.minimum(count - self.need, COUNT_SIZE - 1)
+        # transition[状态, 动作]：没有人死亡时的下一个状态，非法动作为 -1
+        self.transition = np.where(self.legal, new_count * COMBO_SIZE + new_combo, -1)
+
+        # 单步判定用的 Python 列表，避免 NumPy 标量索引的开销
+        self.outcome_list = self.outcome.tolist()
+        self.transition_list = [[divmod(t, COMBO_SIZE) if t >= 0 else None for t in row] for row in self.transition.tolist()]
+        self.reward_list = [list(zip(ra, rb)) for ra, rb in zip(self.reward_a.tolist(), self.reward_b.tolist())]
+
+    def judge(self, state_a, state_b, action_a, action_b):  # 支持 NumPy 数组批量判定，状态和动作都是编号
+        ended = self.outcome[action_a, action_b]
+        state_a = np.where(ended == 0, self.transition[state_a, action_a], state_a)
+        state_b = np.where(ended == 0, self.transition[state_b, action_b], state_b)
+        return ended, state_a, state_b, self.reward_a[action_a, action_b], self.reward_b[action_a, action_b]
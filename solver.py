@@ -0,0 +1,120 @@
+import os
+import sys
+import json
+import time
+import joblib
+import numpy as np
+from q_table import QTable
+from rules import Rules, MOVEMENT_TABLE
+from state_space import RAW_SIZE, VALID_RAW, OBSERVE, encode
+
+# 用 Shapley 值迭代直接求解完整状态空间上的零和随机博弈
+# 状态为 (我的真实状态, 对方的真实状态)，收益取双方奖励之差的一半：胜 +5，负 -5，继续为 0
+
+
+def regret_strategy(regret, legal):  # 正遗憾归一化，全为 0 时均匀随机
+    positive = np.where(legal, regret, 0)
+    total = positive.sum(axis=1, keepdims=True)
+    return np.where(total > 0, positive / np.where(total > 0, total, 1), legal / legal.sum(axis=1, keepdims=True))
+
+
+def regret_matching(matrix, legal_a, legal_b, iterations):  # 对所有状态的矩阵博弈同时进行 regret matching+
+    regret_a, regret_b = np.zeros(legal_a.shape), np.zeros(legal_b.shape)
+    average_a, average_b = np.zeros(legal_a.shape), np.zeros(legal_b.shape)
+    for t in range(1, iterations + 1):
+        y = regret_strategy(regret_b, legal_b)
+        utility = (matrix @ y[:, :, None])[:, :, 0]
+        x = regret_strategy(regret_a, legal_a)
+        regret_a = np.where(legal_a, np.maximum(regret_a + utility - (x * utility).sum(axis=1, keepdims=True), 0), 0)
+        x = regret_strategy(regret_a, legal_a)  # 交替更新
+        utility = -(x[:, None, :] @ matrix)[:, 0, :]
+        regret_b = np.where(legal_b, np.maximum(regret_b + utility - (y * utility).sum(axis=1, keepdims=True), 0), 0)
+        average_a += t * x  # 线性加权平均
+        average_b += t * y
+    x = average_a / average_a.sum(axis=1, keepdims=True)
+    y = average_b / average_b.sum(axis=1, keepdims=True)
+    upper = np.where(legal_a, (matrix @ y[:, :, None])[:, :, 0], -np.inf).max(axis=1)
+    lower = np.where(legal_b, (x[:, None, :] @ matrix)[:, 0, :], np.inf).min(axis=1)
+    return (upper + lower) / 2, upper - lower, x, y
+
+
+def solve(rules, GAMMA, ITERATIONS=100, INNER_ITERATIONS=100, TOLERANCE=1e-2):
+    size = len(VALID_RAW)
+    position = np.full(RAW_SIZE, -1)
+    position[VALID_RAW] = np.arange(size)
+    legal = rules.legal[VALID_RAW]  # [状态, 动作]
+    next_position = np.where(legal, position[np.maximum(rules.transition[VALID_RAW], 0)], 0)  # 非法动作随便指向一个状态，之后会被屏蔽
+    legal_a = np.repeat(legal, size, axis=0)  # [联合状态, A 动作]
+    legal_b = np.tile(legal, (size, 1))  # [联合状态, B 动作]
+    terminal = 5.0 * rules.outcome
+    cont = rules.outcome == 0
+
+    def stage_matrix(value):  # [联合状态, A 动作, B 动作]
+        future = value[next_position[:, None, :, None], next_position[None, :, None, :]]
+        return (terminal + cont * GAMMA * future).reshape(size * size, *terminal.shape)
+
+    value = np.zeros((size, size))
+    for iteration in range(ITERATIONS):
+        new_value, gap, _, _ = regret_matching(stage_matrix(value), legal_a, legal_b, INNER_ITERATIONS)
+        delta = np.abs(new_value.reshape(size, size) - value).max()
+        value = new_value.reshape(size, size)
+        print(f"Iteration {iteration + 1}: delta {delta:.6f}, gap {gap.max():.6f}")
+        if delta < TOLERANCE:
+            break
+    matrix = stage_matrix(value)
+    _, gap, x, y = regret_matching(matrix, legal_a, legal_b, INNER_ITERATIONS * 10)  # 最后多迭代一些，得到更准确的策略
+    print(f"Final gap {gap.max():.6f}")
+    action_value = np.where(legal_a, (matrix @ y[:, :, None])[:, :, 0], -np.inf)  # 每个动作对纳什对手的收益
+
+    # 扩展回以 rules.encode 为下标的完整表
+    full_value = np.zeros((RAW_SIZE, RAW_SIZE))
+    full_value[np.ix_(VALID_RAW, VALID_RAW)] = value
+    full_strategy = np.zeros((RAW_SIZE, RAW_SIZE, len(rules.actions)))
+    full_strategy[np.ix_(VALID_RAW, VALID_RAW)] = x.reshape(size, size, -1)
+    full_action_value = np.full((RAW_SIZE, RAW_SIZE, len(rules.actions)), -np.inf)
+    full_action_value[np.ix_(VALID_RAW, VALID_RAW)] = action_value.reshape(size, size, -1)
+    return full_value, full_strategy, full_action_value
+
+
+def to_q_table(strategy, action_value):  # 对方状态按模糊后的分组取平均，得到旧的 joblib 格式
+    q_table = QTable(MOVEMENT_TABLE)
+    own, opponent = np.repeat(VALID_RAW, len(VALID_RAW)), np.tile(VALID_RAW, len(VALID_RAW))
+    state_ids = OBSERVE[own, opponent]
+    probability = np.zeros_like(q_table.reward)
+    reward = np.zeros_like(q_table.reward)
+    np.add.at(probability, state_ids, strategy[own, opponent])  # 按顺序累加，与逐个状态相加的结果相同
+    np.add.at(reward, state_ids, np.where(q_table.legal[state_ids], action_value[own, opponent], 0))
+    count = np.maximum(np.bincount(state_ids, minlength=len(q_table.reward)), 1)[:, None]
+    q_table.reward = np.where(q_table.legal, reward / count, -np.inf)
+    table = q_table.to_dict()
+    for state, movements in table.items():
+        state_id = encode(state)
+        for movement, v in movements.items():
+            v["probability"] = float(probability[state_id, q_table.action_id[movement]] / count[state_id, 0])
+    return table
+
+
+def main(args):
+    with open(args[0], "r") as f:
+        HYPERPARAMETER_DICT = json.load(f)
+    if len(args) > 1:
+        path = args[1]
+    else:
+        path = os.path.join("model", f"Nash_{time.strftime('%Y-%m-%d_%H-%M-%S', time.localtime())}")
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    rules = Rules(MOVEMENT_TABLE)
+    value, strategy, action_value = solve(
+        rules,
+        HYPERPARAMETER_DICT["GAMMA"],
+        HYPERPARAMETER_DICT.get("SOLVER_ITERATIONS", 100),
+        HYPERPARAMETER_DICT.get("SOLVER_INNER_ITERATIONS", 100),
+        HYPERPARAMETER_DICT.get("SOLVER_TOLERANCE", 1e-2)
+    )
+    np.savez(path + ".npz", value=value, strategy=strategy, action_value=action_value, actions=np.array(rules.actions))
+    joblib.dump(to_q_table(strategy, action_value), path + ".joblib", compress=4)
+    print(f"Saved Nash strategy in files {path}.npz and {path}.joblib")
+    print(f"Game value at the start: {value[0, 0]:.4f}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,76 @@
+import numpy as np
+
+# 状态空间的编码，所有模块共用
+# 真实状态 (生化数量, 连续生化数量) 编号为 生化数量 * COMBO_SIZE + 连续生化数量（rules 中的状态编号）
+# Q 表状态 ((i, k), (j, s)) 中 i、k 为我的真实状态，j、s 为对方模糊后的状态，编号为 STATE_SHAPE = (i, j, k, s) 上的行优先编号
+COUNT_SIZE, COMBO_SIZE = 16, 6
+RAW_SIZE = COUNT_SIZE * COMBO_SIZE
+RAW_COUNT, RAW_COMBO = np.divmod(np.arange(RAW_SIZE), COMBO_SIZE)  # 每个真实状态编号的生化数量和连续生化数量
+VALID_RAW = np.flatnonzero(RAW_COMBO <= RAW_COUNT)  # 连续生化不超过生化数量
+
+# 模糊表：BLUR_COUNT[生化数量]、BLUR_COMBO[连续生化数量] 为模糊后的分组
+BLUR_COUNT = np.array([0, 1, 2, 3, 3, 4, 4, 5, 5, 5, 6, 6, 6, 7, 7, 7])
+BLUR_COMBO = np.array([0, 1, 2, 3, 3, 4])
+# 反模糊表：UNBLUR_COUNT[分组]、UNBLUR_COMBO[分组] 为这个分组包含的真实数量的范围 [最小值, 最大值]
+UNBLUR_COUNT = np.stack([np.searchsorted(BLUR_COUNT, np.arange(BLUR_COUNT[-1] + 1)), np.searchsorted(BLUR_COUNT, np.arange(BLUR_COUNT[-1] + 1), side="right") - 1], axis=1)
+UNBLUR_COMBO = np.stack([np.searchsorted(BLUR_COMBO, np.arange(BLUR_COMBO[-1] + 1)), np.searchsorted(BLUR_COMBO, np.arange(BLUR_COMBO[-1] + 1), side="right") - 1], axis=1)
+_BLUR_COUNT, _BLUR_COMBO = BLUR_COUNT.tolist(), BLUR_COMBO.tolist()  # 逐个状态查表时用列表，避免 NumPy 标量索引的开销
+
+STATE_SHAPE = (COUNT_SIZE, len(UNBLUR_COUNT), COMBO_SIZE, len(UNBLUR_COMBO))  # (16, 8, 6, 5)
+STATE_SIZE = int(np.prod(STATE_SHAPE))
+STATE_I, STATE_J, STATE_K, STATE_S = np.unravel_index(np.arange(STATE_SIZE), STATE_SHAPE)  # 每个 Q 表状态编号的 i、j、k、s
+VALID = (STATE_I >= STATE_K) & (STATE_J >= STATE_S)  # 合法的 Q 表状态
+# OBSERVE[我的状态编号, 对方状态编号]：对应的 Q 表状态编号（对方状态模糊后）
+OBSERVE = np.ravel_multi_index((RAW_COUNT[:, None], BLUR_COUNT[RAW_COUNT][None, :], RAW_COMBO[:, None], BLUR_COMBO[RAW_COMBO][None, :]), STATE_SHAPE)
+
+
+def encode_raw(state):  # (生化数量, 连续生化数量) -> 真实状态编号，也可以是两个数组
+    return state[0] * COMBO_SIZE + state[1]
+
+
+def decode_raw(raw_id):  # 真实状态编号 -> (生化数量, 连续生化数量)
+    count, combo = divmod(int(raw_id), COMBO_SIZE)
+    return count, combo
+
+
+def blur(state):  # 真实状态 -> 模糊后的状态
+    return _BLUR_COUNT[state[0]], _BLUR_COMBO[state[1]]
+
+
+def unblur(state):  # 模糊后的状态 -> (生化数量的范围, 连续生化数量的范围)，范围包含两端
+    return tuple(UNBLUR_COUNT[state[0]].tolist()), tuple(UNBLUR_COMBO[state[1]].tolist())
+
+
+def encode(state):  # ((i, k), (j, s)) -> Q 表状态编号
+    (i, k), (j, s) = state
+    return ((i * STATE_SHAPE[1] + j) * STATE_SHAPE[2] + k) * STATE_SHAPE[3] + s
+
+
+def decode(state_id):  # Q 表状态编号 -> ((i, k), (j, s))
+    return (int(STATE_I[state_id]), int(STATE_K[state_id])), (int(STATE_J[state_id]), int(STATE_S[state_id]))
+
+
+def encode_states(states, raw=False):  # [n, 4] 的 (i, k, j, s) -> Q 表状态编号，超出范围或不合法的状态为 -1；raw 表示对方状态是真实的，先模糊
+    i, k, j, s = np.asarray(states, dtype=np.int64).reshape(-1, 4).T
+    if raw:
+        inside = (j >= 0) & (j < COUNT_SIZE) & (s >= 0) & (s < COMBO_SIZE)
+        j = np.where(inside, BLUR_COUNT[np.clip(j, 0, COUNT_SIZE - 1)], -1)
+        s = np.where(inside, BLUR_COMBO[np.clip(s, 0, COMBO_SIZE - 1)], -1)
+    inside = np.ones(len(i), dtype=bool)
+    for value, size in zip((i, j, k, s), STATE_SHAPE):
+        inside &= (value >= 0) & (value < size)
+    ids = np.ravel_multi_index([np.where(inside, value, 0) for value in (i, j, k, s)], STATE_SHAPE)
+    return np.where(inside & VALID[ids], ids, -1)
+
+
+def decode_states(state_ids):  # Q 表状态编号 -> [n, 4] 的 (i, k, j, s)
+    state_ids = np.asarray(state_ids)
+    return np.stack([STATE_I[state_ids], STATE_K[state_ids], STATE_J[state_ids], STATE_S[state_ids]], axis=-1)
+
+
+def legal_raw(need, combo):  # [真实状态编号, 动作] 的合法动作，need 和 combo 为每个动作需要的生化数量和连续生化数量
+    return (need[None, :] <= RAW_COUNT[:, None]) & (combo[None, :] <= RAW_COMBO[:, None])
+
+
+def legal_states(need, combo):  # [Q 表状态编号, 动作] 的合法动作，不合法的状态没有合法动作
+    return VALID[:, None] & (need[None, :] <= STATE_I[:, None]) & (combo[None, :] <= STATE_K[:, None])
@@ -0,0 +1,103 @@
+import os
+import sys
+import numpy as np
+from state_space import STATE_I, STATE_J, STATE_K, STATE_S
+
+# 策略图：横轴为我的”生“数量 + 连续”生“数量（0~20），纵轴为对方的（模糊后，0~11），每格为出现最多的最优动作
+MAP_SHAPE = (21, 12)
+PALETTE = np.array([  # 按动作编号取颜色，每一帧、每次训练的颜色都相同
+    (31, 119, 180),  # 蓝
+    (255, 127, 14),  # 橙
+    (44, 160, 44),  # 绿
+    (214, 39, 40),  # 红
+    (148, 103, 189),  # 紫
+    (140, 86, 75),  # 棕
+    (227, 119, 194),  # 粉
+    (127, 127, 127),  # 灰
+    (188, 189, 34),  # 黄绿
+    (23, 190, 207),  # 青
+    (174, 199, 232),  # 浅蓝
+    (255, 187, 120),  # 浅橙
+    (152, 223, 138),  # 浅绿
+    (255, 152, 150),  # 浅红
+    (197, 176, 213),  # 浅紫
+    (196, 156, 148),  # 浅棕
+    (247, 182, 210),  # 浅粉
+    (199, 199, 199),  # 浅灰
+    (219, 219, 141),  # 浅黄绿
+    (158, 218, 229),  # 浅青
+], dtype=np.uint8)
+CELL = (STATE_I + STATE_K) * MAP_SHAPE[1] + (STATE_J + STATE_S)  # 每个 Q 表状态所在的格子
+
+
+def best_action_grid(q_table):  # 每格中各状态最优动作的众数，并列时取编号小的动作
+    n = q_table.reward.shape[1]
+    best = q_table.reward.argmax(axis=1)
+    count = np.bincount(CELL[q_table.valid] * n + best[q_table.valid], minlength=MAP_SHAPE[0] * MAP_SHAPE[1] * n)
+    return count.reshape(*MAP_SHAPE, n).argmax(axis=2).astype(np.uint8)
+
+
+def append_frame(path, grid):  # 每帧只有 21×12 字节，直接追加到帧文件中
+    with open(path, "ab") as f:
+        f.write(grid.tobytes())
+
+
+def count_frames(path):  # 帧文件中的帧数，文件不存在时为 0
+    return os.path.getsize(path) // (MAP_SHAPE[0] * MAP_SHAPE[1]) if os.path.exists(path) else 0
+
+
+def truncate_frames(path, count):  # 只保留前 count 帧，从检查点继续训练时丢掉检查点之后追加的帧
+    if os.path.exists(path):
+        with open(path, "r+b") as f:
+            f.truncate(count * MAP_SHAPE[0] * MAP_SHAPE[1])
+
+
+def load_frames(path):
+    return np.fromfile(path, dtype=np.uint8).reshape(-1, *MAP_SHAPE)
+
+
+class LazyFrame:  # append_images 中的一帧，只保存 21×12 的调色板小图，编码器转换这一帧时才放大，同一时刻只有一帧全尺寸图像
+    # save 会把 append_images 整个转换成列表，所以不能用生成器；这里只实现 WebP 编码器逐帧读取时用到的属性和方法
+    mode = "P"
+    n_frames = 1
+    has_transparency_data = False
+
+    def __init__(self, small, size, resample):
+        self.small, self.size, self.resample, self.info = small, size, resample, {}
+
+    def seek(self, frame):
+        pass
+
+    def load(self):
+        pass
+
+    def convert(self, mode):
+        return self.small.resize(self.size, self.resample).convert(mode)
+
+
+def render(frames_path, path, size=(1200, 1200)):  # 把帧文件渲染成 WebP 动图，可以在训练结束后单独运行，内存占用与帧数无关
+    import PIL.Image as Image  # 只在渲染时需要
+    frames = load_frames(frames_path)
+    if len(frames) == 0:
+        return None
+    palette = PALETTE.ravel().tolist()
+    images = []
+    for grid in frames:  # 调色板模式每帧只占 1 字节/像素，编码时再逐帧放大并转换为 RGB
+        img = Image.fromarray(np.ascontiguousarray(grid.T))
+        img.putpalette(palette)  # 灰度图加上调色板即为调色板模式
+        images.append(LazyFrame(img, size, Image.Resampling.NEAREST))
+    images[0].small.resize(size, Image.Resampling.NEAREST).save(
+        path,
+        save_all=True,
+        append_images=images[1:],
+        duration=500,
+        loop=1,
+        lossless=False,
+        quality=100,
+        format="WebP"
+    )
+    return path
+
+
+if __name__ == "__main__":
+    print(render(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else "map.webp"))
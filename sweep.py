@@ -0,0 +1,175 @@
+import os
+import sys
+import json
+import math
+import time
+import shutil
+import itertools
+import contextlib
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import train  # 在创建进程池之前导入，fork 出来的进程直接共用已经构建好的规则表和状态表
+
+# sweep.py 搜索配置路径 [输出文件夹]
+# 搜索配置是一个 JSON 文件，例如：
+# {
+#   "base": "config.json",                                  基础超参数配置的路径或者字典
+#   "grid": {"GAMMA": [0.8, 0.9, 0.95]},                    网格搜索，取所有组合
+#   "random": {"ALPHA_0": {"low": 0.05, "high": 0.5, "log": true}, "TEMPERATURE_0": [1.0, 2.0]},  随机搜索，列表为均匀选择，区间可以加 "int": true
+#   "trials": 10,                                           每个网格点随机抽样的次数，默认为 1
+#   "seed": 0,                                              抽样的随机种子
+#   "min_games": 20000,                                     第一轮训练的游戏数，默认为 TOTAL_GAME_ROUND / eta^3，至少为 (window + 1) * TEST_PER_ROUND
+#   "eta": 3,                                               每一轮只保留得分最高的 1/eta 个试验继续训练
+#   "window": 3,                                            得分为每种测试最近 window 次胜率的平均值的平均值
+#   "workers": 4,                                           同时训练的试验数，默认为 CPU 数
+#   "keep": 3                                               保留得分最高的几个模型
+# }
+# 每个试验在输出文件夹中有自己的文件夹，每一轮从上一轮的检查点继续训练，所以结果与不中断地训练到相同局数完全相同
+# 中断后重新运行同一个搜索时，已经完成的轮直接使用 results.json 中的结果，正在进行的轮从各个试验的检查点继续
+
+
+def sample_configs(spec, base):  # 返回每个试验修改的超参数
+    rng = np.random.default_rng(spec.get("seed", 0))
+    grid = spec.get("grid", {})
+    configs = []
+    for point in itertools.product(*grid.values()):
+        for _ in range(spec.get("trials", 1)):
+            config = dict(zip(grid.keys(), point))
+            for key, space in spec.get("random", {}).items():
+                if isinstance(space, list):
+                    config[key] = space[rng.integers(len(space))]
+                elif space.get("log", False):
+                    config[key] = float(math.exp(rng.uniform(math.log(space["low"]), math.log(space["high"]))))
+                else:
+                    config[key] = float(rng.uniform(space["low"], space["high"]))
+                if isinstance(space, dict) and space.get("int", False):
+                    config[key] = int(round(config[key]))
+            configs.append(config)
+    for config in configs:
+        for key in config:
+            if key not in base:
+                print(f"Warning: {key} is not in the base hyperparameters")
+    return configs
+
+
+def budgets(min_games, eta, total):  # 每一轮训练到的游戏数
+    rungs = []
+    games = min_games
+    while games < total:
+        rungs.append(games)
+        games *= eta
+    return rungs + [total]
+
+
+def tests_after_start(games, TEST_PER_ROUND):  # 训练到 games 局时第 0 局之后的测试次数，训练结束时不再测试
+    return math.ceil(games / TEST_PER_ROUND) - 1
+
+
+def score(test_data, window):
+    return float(np.mean([np.mean(v[-window:]) for v in test_data.values()])) if len(test_data) > 0 else 0.0
+
+
+def init_worker():
+    os.environ["TQDM_DISABLE"] = "1"  # 进度条只会写进日志，没有意义
+
+
+def run_trial(directory, config, games):  # 在工作进程中把一个试验训练到 games 局，返回测试数据和模型路径
+    config = dict(config, TOTAL_GAME_ROUND=games, HEADLESS=True, WORKERS=1, CHECKPOINT_PATH="checkpoint")  # 并行已经在试验之间进行
+    cwd = os.getcwd()
+    os.chdir(directory)
+    try:
+        with open("config.json", "w") as f:
+            json.dump(config, f, indent=2)
+        resume = os.path.exists(os.path.join("checkpoint", "manifest.json"))
+        with open("train.log", "a", encoding="utf-8") as log, contextlib.redirect_stdout(log), contextlib.redirect_stderr(log):
+            train.main(["--resume", "checkpoint", "config.json"] if resume else ["config.json"])
+        models = sorted(os.listdir("model"))
+        for name in models[:-1]:  # 每一轮结束都会保存模型，只保留最新的
+            os.remove(os.path.join("model", name))
+        with open("test_data.json", "r") as f:
+            return json.load(f)["test_data"], os.path.join(directory, "model", models[-1])
+    finally:
+        os.chdir(cwd)
+
+
+def save_results(path, results):
+    temporary = path + ".tmp"
+    with open(temporary, "w") as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    os.replace(temporary, path)
+
+
+def sweep(spec, out):
+    base = spec.get("base", "config.json")
+    if isinstance(base, str):
+        with open(base, "r") as f:
+            base = json.load(f)
+    eta, window, keep = spec.get("eta", 3), spec.get("window", 3), spec.get("keep", 3)
+    total = base["TOTAL_GAME_ROUND"]
+    configs = sample_configs(spec, base)
+    TEST_PER_ROUND = max(dict(base, **config)["TEST_PER_ROUND"] for config in configs)
+    # 第 0 局的测试是未训练的 Q 表，所有试验的结果都相同，第一轮至少要有 window 次之后的测试，否则得分无法区分试验
+    rungs = budgets(spec.get("min_games", max((window + 1) * TEST_PER_ROUND, total // eta ** 3)), eta, total)
+    if tests_after_start(rungs[0], TEST_PER_ROUND) < window:
+        raise ValueError(f"min_games {rungs[0]} gives fewer than window={window} tests after game 0 with TEST_PER_ROUND {TEST_PER_ROUND}, use at least {(window + 1) * TEST_PER_ROUND}")
+    out = os.path.abspath(out)
+    os.makedirs(out, exist_ok=True)
+    trials = []
+    for n, config in enumerate(configs):
+        directory = os.path.join(out, f"trial_{n:03d}")
+        os.makedirs(directory, exist_ok=True)
+        trials.append({"id": n, "config": config, "status": "running", "games": 0, "scores": [], "path": directory, "model": None})
+    if os.path.exists(os.path.join(out, "results.json")):
+        with open(os.path.join(out, "results.json"), "r") as f:
+            previous = json.load(f)
+        if previous["spec"] == spec and previous["rungs"] == rungs:  # 同一个搜索，已经完成的轮不再训练
+            trials = previous["trials"]
+    results = {"spec": spec, "rungs": rungs, "trials": trials, "best": []}
+    print(f"{len(trials)} trial(s), rungs {rungs}")
+
+    context = mp.get_context("fork") if "fork" in mp.get_all_start_methods() else None
+    running = [n for n in range(len(trials)) if trials[n]["status"] != "stopped"]
+    start = time.time()
+    with ProcessPoolExecutor(spec.get("workers", os.cpu_count()), mp_context=context, initializer=init_worker) as pool:
+        for rung, games in enumerate(rungs):
+            futures = {pool.submit(run_trial, trials[n]["path"], dict(base, **trials[n]["config"]), games): n for n in running if len(trials[n]["scores"]) <= rung}
+            for future in as_completed(futures):
+                trial = trials[futures[future]]
+                test_data, trial["model"] = future.result()
+                trial["games"] = games
+                trial["scores"].append(score(test_data, window))
+                trial["test_data"] = test_data
+                save_results(os.path.join(out, "results.json"), results)  # 每完成一个试验就更新一次
+                print(f"[{time.time() - start:.0f}s] rung {rung} trial {trial['id']} games {games}: {trial['scores'][-1]:.3%} {trial['config']}")
+            if rung == len(rungs) - 1:
+                break
+            running.sort(key=lambda n: trials[n]["scores"][rung], reverse=True)
+            for n in running[max(1, math.ceil(len(running) / eta)):]:  # 落后的试验提前停止，删除检查点（历史池很大），保留测试数据和模型
+                trials[n]["status"] = "stopped"
+                shutil.rmtree(os.path.join(trials[n]["path"], "checkpoint"), ignore_errors=True)
+            running = running[:max(1, math.ceil(len(running) / eta))]
+
+    for n in running:
+        trials[n]["status"] = "finished"
+    ranking = sorted(trials, key=lambda t: (len(t["scores"]), t["scores"][-1]), reverse=True)  # 先比较训练的轮数，再比较最后一轮的得分
+    os.makedirs(os.path.join(out, "best"), exist_ok=True)
+    for rank, trial in enumerate(ranking[:keep]):
+        path = os.path.join(out, "best", f"{rank}_trial_{trial['id']:03d}.joblib")
+        shutil.copyfile(trial["model"], path)
+        results["best"].append({"id": trial["id"], "score": trial["scores"][-1], "config": trial["config"], "model": path})
+    save_results(os.path.join(out, "results.json"), results)
+    print(f"Saved sweep results in file {os.path.join(out, 'results.json')}")
+    for best in results["best"]:
+        print(f"{best['score']:.3%} {best['config']} {best['model']}")
+    return results
+
+
+def main(args):  # sweep.py 搜索配置路径 [输出文件夹]
+    with open(args[0], "r") as f:
+        spec = json.load(f)
+    sweep(spec, args[1] if len(args) > 1 else os.path.join("sweep", time.strftime('%Y-%m-%d_%H-%M-%S', time.localtime())))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
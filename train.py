@@ -1,15 +1,19 @@
 from abc import ABC, abstractmethod
-from copy import deepcopy
-from math import exp
 import random
 import time
+import os
 import json
-import joblib
-import matplotlib.pyplot as plt
-import PIL.Image as Image
 import sys
+import signal
 import statistics
-from tqdm import tqdm
+import numpy as np
+from q_table import QTable, AliasCache, softmax, choose, sample
+from rules import Rules, MOVEMENT_TABLE
+from state_space import RAW_SIZE, OBSERVE, encode, encode_raw, decode_raw, blur
+from markov import absorb
+import strategy_map
+
+RULES = Rules(MOVEMENT_TABLE)  # 规则表只读，导入时构建一次，所有 Agent 共用（sweep 在导入之后 fork，试验直接继承）
 
 
 class AbstractActor(ABC):
@@ -17,6 +21,13 @@ class AbstractActor(ABC):
     def choose_action(self, state, use_random=True):
         pass
 
+    @abstractmethod
+    def policy_table(self, rules, use_random=False):  # [我的状态编号, 对方状态编号, 动作] 的概率表，状态编号见 rules.encode
+        pass
+
+    def choose_actions(self, rules, own, opponent, rng, use_random=True):  # 批量选择动作，状态和动作都是编号
+        return sample(self.policy_table(rules, use_random)[own, opponent], rng)
+
 
 class Foolish(AbstractActor):
     def __init__(self, MOVEMENT_TABLE):
@@ -33,6 +44,10 @@ class Foolish(AbstractActor):
                 index += 1
         return chosen
 
+    def policy_table(self, rules, use_random=False):
+        policy = rules.legal / rules.legal.sum(axis=1, keepdims=True)
+        return np.broadcast_to(policy[:, None, :], (RAW_SIZE, RAW_SIZE, len(rules.actions)))
+
 
 class Looper(AbstractActor):
     def __init__(self, rule):
@@ -40,40 +55,53 @@ class Looper(AbstractActor):
     def choose_action(self, state, use_random=True):
         return self.rule(state[0])
 
+    def policy_table(self, rules, use_random=False):
+        policy = np.zeros((RAW_SIZE, len(rules.actions)))
+        for raw_id in range(RAW_SIZE):
+            policy[raw_id, rules.action_id[self.rule(decode_raw(raw_id))]] = 1.0
+        return np.broadcast_to(policy[:, None, :], (RAW_SIZE, RAW_SIZE, len(rules.actions)))
+
+
+class FrozenPolicy(AbstractActor):  # 历史池中的只读策略快照，只保存选择动作需要的东西
+    def __init__(self, actions, reward, temperature, temperature_test):
+        self.actions = actions
+        self.reward = np.array(reward, dtype=np.float32)  # 紧凑的只读副本
+        self.reward.flags.writeable = False
+        self.temperature = temperature  # 快照时的训练温度
+        self.temperature_test = temperature_test
+        # Q 值不会再变，两个温度下的 alias 表在第一次用到某个状态时构建
+        self.caches = {True: AliasCache(self, self.temperature), False: AliasCache(self, self.temperature_test)}
+
+    @classmethod
+    def from_agent(cls, agent):
+        return cls(agent.Q_table.actions, agent.Q_table.reward, agent.get_temperature(agent.game_round), agent.HYPERPARAMETER_DICT["TEMPERATURE_TEST"])
+
+    def choose_action(self, state, use_random=True):
+        return self.actions[self.caches[use_random].draw(encode(state))]
+
+    def policy_table(self, rules, use_random=False):
+        return softmax(self.reward[OBSERVE], self.caches[use_random].t)
+
+    def choose_actions(self, rules, own, opponent, rng, use_random=True):
+        return self.caches[use_random].draws(OBSERVE[own, opponent], rng)
+
 
 class Agent(AbstractActor):
     START_TIME = time.time()
 
     def __init__(self):
         self.HYPERPARAMETER_DICT = {}
-        self.MOVEMENT_TABLE = {
-            "生": {"kill": {"零"}, "need": -1, "combo": 0},
-            "防": {"kill": set(), "need": 0, "combo": 0},
-            "飞": {"kill": set(), "need": 0, "combo": 0},
-            "单": {"kill": {"生", "地"}, "need": 1, "combo": 0},
-            "双": {"kill": {"生", "一", "地"}, "need": 2, "combo": 0},
-            "弯": {"kill": {"单", "双", "镖", "地", "机"}, "need": 1, "combo": 0},
-            "刺": {"kill": {"弯", "肥", "地"}, "need": 1, "combo": 0},
-            "肥": {"kill": {"防", "飞", "弯"}, "need": 5, "combo": 0},
-            "镖": {"kill": {"飞"}, "need": 3, "combo": 0},
-            "零": {"kill": {"防"}, "need": 0, "combo": 0},
-            "一": {"kill": set(), "need": -1, "combo": 1},
-            "二": {"kill": set(), "need": -2, "combo": 2},
-            "三": {"kill": set(), "need": -3, "combo": 3},
-            "四": {"kill": set(), "need": -4, "combo": 4},
-            "五": {"kill": set(), "need": -5, "combo": 5},
-            "胡": {"kill": {"生", "厨"}, "need": 1, "combo": 0},
-            "菜": {"kill": {"胡"}, "need": 1, "combo": 0},
-            "厨": {"kill": {"菜"}, "need": 2, "combo": 0},
-            "地": {"kill": {"生", "一", "二", "三", "四", "五"}, "need": 3, "combo": 0},
-            "机": {"kill": {"生", "防", "飞", "单", "双", "刺", "肥", "镖", "一", "二", "三", "四", "五", "胡", "菜", "厨", "地"}, "need": 10, "combo": 0}
-        }
-        self.Q_table = {}
+        self.MOVEMENT_TABLE = MOVEMENT_TABLE
+        self.rules = RULES
+        self.Q_table = QTable(self.MOVEMENT_TABLE)
         self.game_round = 0  # 总游戏数
         self.total_round = 0  # 总回合数
         self.test_data = {}
         self.path = ""
-        self.images = []
+        self.map_path = "map.frames"  # 策略图的帧文件，见 strategy_map
+        self.test_data_path = "test_data.json"
+        self.trajectory = None  # 设置了 TRAJECTORY_PATH 时为 trajectory.TrajectoryWriter
+        self.replay = None  # 设置了 REPLAY_UPDATES 时为 replay.PrioritizedReplay
 
     def init_q_table_and_configs(self, args):
         if len(args) > 2:
@@ -90,7 +118,8 @@ class Agent(AbstractActor):
             if args[0] == ".":
                 self.init_q_table()
             else:
-                self.Q_table = joblib.load(args[0])
+                import joblib  # joblib 导入很慢，只在读写 Q 表时导入
+                self.Q_table = QTable.from_dict(joblib.load(args[0]), self.MOVEMENT_TABLE)
             if args[1] == ".":
                 self.HYPERPARAMETER_DICT = json.loads(input("Input hyperparameters or press Enter to start training: "))
             else:
@@ -98,60 +127,26 @@ class Agent(AbstractActor):
                     self.HYPERPARAMETER_DICT = json.load(f)
 
     def save_q_table_and_configs(self):
+        import joblib
         if self.path == "":
-            self.path = f"model\\Q_table_{time.strftime('%Y-%m-%d_%H-%M-%S', time.localtime())}.joblib"
-        joblib.dump(self.Q_table, self.path, compress=4)
+            self.path = os.path.join("model", f"Q_table_{time.strftime('%Y-%m-%d_%H-%M-%S', time.localtime())}.joblib")
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        joblib.dump(self.Q_table.to_dict(), self.path, compress=4)
         print(f"Saved Q_table in file {self.path}")
         with open("training-records.txt", "a") as rf:
-            rf.write(f"{time.strftime('%Y-%m-%d_%H-%M-%S', time.localtime())}{self.HYPERPARAMETER_DICT}: {statistics.mean(self.test_data):.3%}\n")
+            rf.write(f"{time.strftime('%Y-%m-%d_%H-%M-%S', time.localtime())}{self.HYPERPARAMETER_DICT}: {statistics.mean(v[-1] for v in self.test_data.values()):.3%}\n")  # 最后一次测试的平均胜率
 
-    @staticmethod
-    def blur(state):
-        if state[0] == 0:
-            state0 = 0
-        elif state[0] <= 1:
-            state0 = 1
-        elif state[0] <= 2:
-            state0 = 2
-        elif state[0] <= 4:
-            state0 = 3
-        elif state[0] <= 6:
-            state0 = 4
-        elif state[0] <= 9:
-            state0 = 5
-        elif state[0] <= 12:
-            state0 = 6
-        else:
-            state0 = 7
-        if state[1] == 0:
-            state1 = 0
-        elif state[1] <= 1:
-            state1 = 1
-        elif state[1] <= 2:
-            state1 = 2
-        elif state[1] <= 4:
-            state1 = 3
-        else:
-            state1 = 4
-        return state0, state1
+    def save_test_data(self):  # 原始的测试数据，之后用 report.py 画图
+        with open(self.test_data_path, "w") as f:
+            json.dump({"HYPERPARAMETER_DICT": self.HYPERPARAMETER_DICT, "test_data": self.test_data}, f, ensure_ascii=False)
 
     def init_q_table(self):  # 初始化 Q 表
         print("Start initializing Q_table.")
-        cnt_movement = 0
-        cnt_state = 0
-        # 使用循环变量来纪念 Dijkstra
-        for i in range(16):  # 我的”生“数量
-            for j in range(8):  # 对方的”生“数量（模糊后）
-                for k in range(6):  # 我的连续”生“数量
-                    for s in range(5):  # 对方的连续”生“数量（模糊后）
-                        if i >= k and j >= s:
-                            self.Q_table[((i, k), (j, s))] = {}
-                            for t in self.MOVEMENT_TABLE.keys():
-                                if self.MOVEMENT_TABLE[t]["need"] <= i and self.MOVEMENT_TABLE[t]["combo"] <= k:
-                                    self.Q_table[((i, k), (j, s))].update({t: {"reward": 0, "episode": 0}})
-                                    cnt_movement += 1
-                            cnt_state += 1
-        print(f"Q_table {hex(hash(str(self.Q_table)))} has been initialized with {cnt_state} state(s) and {cnt_movement} movement(s).")
+        # 合法状态为 i >= k 且 j >= s，合法动作为 need <= i 且 combo <= k，见 state_space
+        self.Q_table = QTable(self.MOVEMENT_TABLE)
+        cnt_state = len(self.Q_table)
+        cnt_movement = int(self.Q_table.legal.sum())
+        print(f"Q_table {hex(hash(self.Q_table.reward.tobytes()))} has been initialized with {cnt_state} state(s) and {cnt_movement} movement(s).")
 
     def get_alpha(self, episode):  # 获取学习率
         ALPHA_0, ALPHA_MIDDLE, ALPHA_MIN, ALPHA_FIRST_DECAY_EPISODES, ALPHA_SECOND_DECAY_EPISODES = self.HYPERPARAMETER_DICT["ALPHA_0"], self.HYPERPARAMETER_DICT["ALPHA_MIDDLE"], self.HYPERPARAMETER_DICT["ALPHA_MIN"], self.HYPERPARAMETER_DICT["ALPHA_FIRST_DECAY_EPISODES"], self.HYPERPARAMETER_DICT["ALPHA_SECOND_DECAY_EPISODES"]
@@ -161,14 +156,61 @@ class Agent(AbstractActor):
             return ALPHA_MIDDLE - (ALPHA_MIDDLE - ALPHA_MIN) * (episode - ALPHA_FIRST_DECAY_EPISODES) / ALPHA_SECOND_DECAY_EPISODES
         return ALPHA_MIN
 
+    def get_alphas(self, episodes):  # 批量获取学习率，与 get_alpha 相同
+        ALPHA_0, ALPHA_MIDDLE, ALPHA_MIN, ALPHA_FIRST_DECAY_EPISODES, ALPHA_SECOND_DECAY_EPISODES = self.HYPERPARAMETER_DICT["ALPHA_0"], self.HYPERPARAMETER_DICT["ALPHA_MIDDLE"], self.HYPERPARAMETER_DICT["ALPHA_MIN"], self.HYPERPARAMETER_DICT["ALPHA_FIRST_DECAY_EPISODES"], self.HYPERPARAMETER_DICT["ALPHA_SECOND_DECAY_EPISODES"]
+        return np.interp(episodes, [0, ALPHA_FIRST_DECAY_EPISODES, ALPHA_FIRST_DECAY_EPISODES + ALPHA_SECOND_DECAY_EPISODES], [ALPHA_0, ALPHA_MIDDLE, ALPHA_MIN])
+
     def update_q_table(self, old_state, new_state, action, reward):  # 更新 Q 表
         GAMMA = self.HYPERPARAMETER_DICT["GAMMA"]
 
-        self.Q_table[old_state][action]["episode"] += 1
-        new_episode_max_reward = max([self.Q_table[new_state][i]["reward"] for i in self.Q_table[new_state].keys()])  # 新一轮的最大奖励
-        old = self.Q_table[old_state][action]["reward"]
-        self.Q_table[old_state][action]["reward"] = old + self.get_alpha(self.Q_table[old_state][action]["episode"]) * (reward + GAMMA * new_episode_max_reward - old)  # 更新 Q 表
-        self.Q_table[old_state][action]["reward"] = max(min(self.Q_table[old_state][action]["reward"], 15), -15)  # 限制奖励范围
+        old_id, new_id, a = encode(old_state), encode(new_state), self.Q_table.action_id[action]
+        episode = self.Q_table.episode.item(old_id, a) + 1  # 逐个更新时用 item 和 Python 标量，避免 NumPy 标量的开销
+        self.Q_table.episode[old_id, a] = episode
+        new_episode_max_reward = max(self.Q_table.reward[new_id].tolist())  # 新一轮的最大奖励
+        old = self.Q_table.reward.item(old_id, a)
+        new = old + self.get_alpha(episode) * (reward + GAMMA * new_episode_max_reward - old)  # 更新 Q 表
+        self.Q_table.reward[old_id, a] = max(min(new, 15), -15)  # 限制奖励范围
+        self.Q_table.invalidate(old_id)
+        if self.replay is not None:
+            self.replay.record(old_id, new_id, a, reward)
+
+    def update_q_table_batch(self, old_ids, new_ids, actions, rewards):  # 批量更新 Q 表，状态为 Q 表状态编号，动作为编号
+        GAMMA = self.HYPERPARAMETER_DICT["GAMMA"]
+
+        reward, episode = self.Q_table.reward.reshape(-1), self.Q_table.episode.reshape(-1)
+        target = rewards + GAMMA * self.Q_table.reward[new_ids].max(axis=1)  # 都用更新前的 Q 表
+        key = old_ids * self.Q_table.reward.shape[1] + actions
+        order = np.argsort(key, kind="stable")
+        key, target = key[order], target[order]
+        start = np.flatnonzero(np.r_[True, key[1:] != key[:-1]])  # 每个 (状态, 动作) 第一次出现的位置
+        group = np.repeat(np.arange(len(start)), np.diff(np.r_[start, len(key)]))
+        rank = np.arange(len(key)) - start[group]
+        alpha = self.get_alphas(episode[key] + rank + 1)  # 每次更新都有自己的 episode
+        # 同一 (状态, 动作) 的多次更新与依次执行等价：q <- q * prod(1 - alpha) + sum(alpha_i * target_i * prod_{j > i}(1 - alpha_j))
+
+        def suffix(values):  # 每组的总和，以及每次更新之后（不含这次）的部分和
+            cumulative = np.cumsum(values)
+            total = np.add.reduceat(values, start)
+            return total, total[group] - (cumulative - (cumulative[start] - values[start])[group])
+
+        unique_key = key[start]
+        if alpha.max() < 1:  # 通常所有因子都为正，直接在对数空间中连乘
+            log_total, log_after = suffix(np.log1p(-alpha))
+            new = reward[unique_key] * np.exp(log_total) + np.add.reduceat(alpha * np.exp(log_after) * target, start)
+        else:  # alpha 为 1 的更新完全覆盖之前的值，每组只需从最后一次这样的更新开始计算；alpha 大于 1 时因子为负，单独记录符号
+            keep = 1 - alpha
+            reset = keep == 0
+            last = np.maximum.reduceat(np.where(reset, np.arange(len(key)), -1), start)  # 没有这样的更新时为 -1
+            log_total, log_after = suffix(np.log(np.abs(np.where(reset, 1.0, keep))))
+            flip_total, flip_after = suffix((keep < 0).astype(np.int64))
+            old = np.where(last < 0, (1 - 2 * (flip_total % 2)) * np.exp(log_total), 0.0)
+            live = np.arange(len(key)) >= last[group]
+            new = reward[unique_key] * old + np.add.reduceat(np.where(live, alpha * (1 - 2 * (flip_after % 2)) * np.exp(log_after) * target, 0.0), start)
+        reward[unique_key] = np.clip(new, -15, 15)  # 限制奖励范围
+        episode[unique_key] += np.diff(np.r_[start, len(key)])
+        self.Q_table.invalidate(old_ids)
+        if self.replay is not None:
+            self.replay.add(old_ids, new_ids, actions, rewards)
 
     def get_temperature(self, rounds):  # 获取温度
         TEMPERATURE_0, TEMPERATURE_MIN, TEMPERATURE_DECAY_ROUNDS = self.HYPERPARAMETER_DICT["TEMPERATURE_0"], self.HYPERPARAMETER_DICT["TEMPERATURE_MIN"], self.HYPERPARAMETER_DICT["TEMPERATURE_DECAY_ROUNDS"]
@@ -177,51 +219,31 @@ class Agent(AbstractActor):
         return TEMPERATURE_MIN
 
     def choose_action(self, state, use_random=True):  # 选择动作
+        if use_random:
+            state_id = encode(state)
+            return self.Q_table.actions[choose(self.Q_table.reward[state_id].tolist(), self.Q_table.legal_list[state_id], self.get_temperature(self.game_round))]
+        return self.Q_table.actions[self.Q_table.alias(self.HYPERPARAMETER_DICT["TEMPERATURE_TEST"]).draw(encode(state))]  # 测试温度固定，使用缓存
+
+    def policy_table(self, rules, use_random=False):
         if use_random:
             t = self.get_temperature(self.game_round)
         else:
             t = self.HYPERPARAMETER_DICT["TEMPERATURE_TEST"]
-        movements = self.Q_table[state]
-        weight = [(i, exp(movements[i]["reward"] / t)) for i in movements.keys()]
-        weighted_range = [0.0]
-        for i in range(len(movements)):
-            weighted_range.append(weighted_range[-1] + weight[i][1])
-        weighted_range = weighted_range[1:]
-        rand = random.uniform(0, weighted_range[-1])
-        for i in range(len(weighted_range)):
-            if rand <= weighted_range[i]:
-                return weight[i][0]
-        return weight[-1][0]
+        return softmax(self.Q_table.reward[OBSERVE], t)
+
+    def choose_actions(self, rules, own, opponent, rng, use_random=True):
+        if use_random:
+            return sample(softmax(self.Q_table.reward[OBSERVE[own, opponent]], self.get_temperature(self.game_round)), rng)
+        return self.Q_table.alias(self.HYPERPARAMETER_DICT["TEMPERATURE_TEST"]).draws(OBSERVE[own, opponent], rng)
 
     @staticmethod
-    def judge(player_a_state, player_b_state, player_a_action, player_b_action, MOVEMENT_TABLE):
-        now_reward_a, now_reward_b = 0, 0
-        ended = 0
-        if player_b_action in MOVEMENT_TABLE[player_a_action]["kill"]:
-            now_reward_a += 5
-            now_reward_b -= 5
-            ended = 1
-        elif player_a_action in MOVEMENT_TABLE[player_b_action]["kill"]:
-            now_reward_a -= 5
-            now_reward_b += 5
-            ended = -1
-        else:
-            now_reward_a -= 0.2
-            now_reward_b -= 0.2
-            if MOVEMENT_TABLE[player_a_action]["combo"] != 0:
-                player_a_state = (player_a_state[0], 0)
-            elif MOVEMENT_TABLE[player_a_action]["need"] > 0:
-                player_a_state = (player_a_state[0], 0)
-            elif MOVEMENT_TABLE[player_a_action]["need"] != 0:
-                player_a_state = (player_a_state[0], min(player_a_state[1] + 1, 5))
-            player_a_state = (min(player_a_state[0] - MOVEMENT_TABLE[player_a_action]["need"], 15), player_a_state[1])
-            if MOVEMENT_TABLE[player_b_action]["combo"] != 0:
-                player_b_state = (player_b_state[0], 0)
-            elif MOVEMENT_TABLE[player_b_action]["need"] > 0:
-                player_b_state = (player_b_state[0], 0)
-            elif MOVEMENT_TABLE[player_b_action]["need"] != 0:
-                player_b_state = (player_b_state[0], min(player_b_state[1] + 1, 5))
-            player_b_state = (min(player_b_state[0] - MOVEMENT_TABLE[player_b_action]["need"], 15), player_b_state[1])
+    def judge(player_a_state, player_b_state, player_a_action, player_b_action, rules):  # 批量判定见 Rules.judge
+        a, b = rules.action_id[player_a_action], rules.action_id[player_b_action]
+        ended = rules.outcome_list[a][b]
+        if ended == 0:
+            player_a_state = rules.transition_list[encode_raw(player_a_state)][a]
+            player_b_state = rules.transition_list[encode_raw(player_b_state)][b]
+        now_reward_a, now_reward_b = rules.reward_list[a][b]
         return ended, player_a_state, player_b_state, now_reward_a, now_reward_b
 
     def play_round(self, random_starts, opponent):  # 开始一轮游戏
@@ -237,8 +259,8 @@ class Agent(AbstractActor):
         while flag == 0 and round_cnt < 100:  # 循环直到结束一轮游戏
             old_state_a, old_state_b = state_a, state_b
 
-            action_for_a, action_for_b = self.choose_action((state_a, Agent.blur(state_b))), opponent.choose_action((state_b, Agent.blur(state_a)))
-            flag, state_a, state_b, now_reward_a, now_reward_b = self.judge(state_a, state_b, action_for_a, action_for_b, self.MOVEMENT_TABLE)
+            action_for_a, action_for_b = self.choose_action((state_a, blur(state_b))), opponent.choose_action((state_b, blur(state_a)))
+            flag, state_a, state_b, now_reward_a, now_reward_b = self.judge(state_a, state_b, action_for_a, action_for_b, self.rules)
 
             if flag == 0:
                 pass
@@ -247,23 +269,33 @@ class Agent(AbstractActor):
             elif flag == -1:
                 pass
 
-            self.update_q_table((old_state_a, Agent.blur(old_state_b)), (state_a, Agent.blur(state_b)), action_for_a, now_reward_a)
-            # self.update_q_table((old_state_b, Agent.blur(old_state_a)), (state_b, Agent.blur(state_a)), action_for_b, now_reward_b)
+            self.update_q_table((old_state_a, blur(old_state_b)), (state_a, blur(state_b)), action_for_a, now_reward_a)
+            if self.trajectory is not None:
+                self.trajectory.record(0, round_cnt, flag != 0 or round_cnt >= 99, encode_raw(old_state_a), encode_raw(old_state_b), encode_raw(state_a), encode_raw(state_b), self.rules.action_id[action_for_a], self.rules.action_id[action_for_b], now_reward_a)
+            # self.update_q_table((old_state_b, blur(old_state_a)), (state_b, blur(state_a)), action_for_b, now_reward_b)
             round_cnt += 1
+        if self.replay is not None:
+            self.replay.flush()
         self.total_round += round_cnt
         self.game_round += 1
 
     @staticmethod
     def test(Agent1, Agent2, tag):
+        if Agent1.HYPERPARAMETER_DICT.get("TEST_MODE", "sample") == "exact":  # 用马尔可夫链精确计算胜率
+            win_rate, _, _ = absorb(Agent1.rules, Agent1.policy_table(Agent1.rules), Agent2.policy_table(Agent1.rules))
+            if tag not in Agent1.test_data:
+                Agent1.test_data[tag] = []
+            Agent1.test_data[tag].append(float(win_rate))
+            return
         ROUND_PER_TEST = Agent1.HYPERPARAMETER_DICT["ROUND_PER_TEST"]
         win_cnt = 0
         # print("Win: ", end="")
         for i in range(ROUND_PER_TEST):
             state_a, state_b = (0, 0), (0, 0)
             for _ in range(100):  # 如果回合数大于 100 就直接判定为输
-                action_a = Agent1.choose_action((state_a, Agent.blur(state_b)), False)  # 按照 Q 表选择动作
-                action_b = Agent2.choose_action((state_b, Agent.blur(state_a)), False)
-                flag, state_a, state_b, _, _ = Agent.judge(state_a, state_b, action_a, action_b, Agent1.MOVEMENT_TABLE)
+                action_a = Agent1.choose_action((state_a, blur(state_b)), False)  # 按照 Q 表选择动作
+                action_b = Agent2.choose_action((state_b, blur(state_a)), False)
+                flag, state_a, state_b, _, _ = Agent.judge(state_a, state_b, action_a, action_b, Agent1.rules)
                 if flag != 0:
                     if flag == 1:
                         win_cnt += 1
@@ -274,116 +306,168 @@ class Agent(AbstractActor):
             Agent1.test_data[tag] = []
         Agent1.test_data[tag].append(win_rate)
 
-    def make_map(self):
-        colors = [
-            (31, 119, 180),  # 蓝
-            (255, 127, 14),  # 橙
-            (44, 160, 44),  # 绿
-            (214, 39, 40),  # 红
-            (148, 103, 189),  # 紫
-            (140, 86, 75),  # 棕
-            (227, 119, 194),  # 粉
-            (127, 127, 127),  # 灰
-            (188, 189, 34),  # 黄绿
-            (23, 190, 207),  # 青
-            (174, 199, 232),  # 浅蓝
-            (255, 187, 120),  # 浅橙
-            (152, 223, 138),  # 浅绿
-            (255, 152, 150),  # 浅红
-            (197, 176, 213),  # 浅紫
-            (196, 156, 148),  # 浅棕
-            (247, 182, 210),  # 浅粉
-            (199, 199, 199),  # 浅灰
-            (219, 219, 141),  # 浅黄绿
-            (158, 218, 229),  # 浅青
-        ]
-        movement_color_dict = {}
-        best_movement_table = [[[] for _ in range(12)] for _ in range(21)]
-        for k, v in self.Q_table.items():
-            for kk, vv in v.items():
-                best_movement_table[k[0][0] + k[0][1]][k[1][0] + k[1][1]].append(kk)
-        for i in range(21):
-            for j in range(12):
-                best_movement_table[i][j] = statistics.multimode(best_movement_table[i][j])[0]
-        img = Image.new('RGB', (21, 12))
-        pixels = img.load()
-        for i in range(21):
-            for j in range(12):
-                if best_movement_table[i][j] not in movement_color_dict:
-                    movement_color_dict[best_movement_table[i][j]] = colors.pop(0)
-                pixels[i, j] = movement_color_dict[best_movement_table[i][j]]
-        img = img.resize((1200, 1200), Image.Resampling.NEAREST)
-        self.images.append(img)
+    def make_map(self):  # 把当前的策略图追加到帧文件
+        strategy_map.append_frame(self.map_path, strategy_map.best_action_grid(self.Q_table))
 
     def make_webp(self, path):
-        self.images[0].save(
-            path,
-            save_all=True,
-            append_images=self.images[1:],
-            duration=500,
-            loop=1,
-            lossless=False,
-            quality=100,
-            format="WebP"
-        )
-        return path
+        return strategy_map.render(self.map_path, path)
 
 
-def main(args):
-    random.seed(42)
-    trainee = Agent()
-    trainee.init_q_table_and_configs(args)
-    print(trainee.HYPERPARAMETER_DICT)
-    randomer = Foolish(trainee.MOVEMENT_TABLE)
-    loopers = [
+def make_loopers():  # 一些简单的策略
+    return [
         Looper(lambda s: "一" if s[1] >= 1 else ("单" if s[0] >= 1 else "生")),
         Looper(lambda s: "一" if s[1] >= 1 else ("双" if s[0] >= 2 else "生")),
         Looper(lambda s: "二" if s[1] >= 2 else ("地" if s[0] >= 3 else "生"))
     ]
+
+
+def add_history(history, trainee):  # 复制自身进入历史池
+    history.append(FrozenPolicy.from_agent(trainee))
+    if len(history) > 20:
+        history.pop(random.randint(0, len(history) - 1))
+
+
+def play_game(trainee, history, loopers, randomer):  # 按比例选择对手并进行一局游戏
+    r = random.random()
+    random_starts = random.random() < 0.6
+    if r < 0.6 and len(history) > 0:
+        trainee.play_round(random_starts, random.choice(history))
+    elif r < 0.8:
+        trainee.play_round(random_starts, trainee)
+    elif r < 0.95:
+        trainee.play_round(random_starts, random.choice(loopers))
+    else:
+        trainee.play_round(random_starts, randomer)
+
+
+def make_replay(trainee):  # REPLAY_UPDATES 大于 0 时使用优先级重放
+    HYPERPARAMETER_DICT = trainee.HYPERPARAMETER_DICT
+    if HYPERPARAMETER_DICT.get("REPLAY_UPDATES", 0) <= 0:
+        return None
+    from replay import PrioritizedReplay
+    return PrioritizedReplay(trainee, HYPERPARAMETER_DICT.get("REPLAY_SIZE", 65536), HYPERPARAMETER_DICT["REPLAY_UPDATES"], HYPERPARAMETER_DICT.get("REPLAY_BATCH", 256), HYPERPARAMETER_DICT.get("REPLAY_THRESHOLD", 0.01))
+
+
+def make_batch(trainee, history, loopers, randomer, rng):  # 同步推进多局游戏的引擎，每次只玩一局时返回 None
+    PLAYERS, BATCH_SIZE = trainee.HYPERPARAMETER_DICT.get("PLAYERS", 2), trainee.HYPERPARAMETER_DICT.get("BATCH_SIZE", 1)
+    if PLAYERS > 2:  # 多人游戏
+        from multiplayer import MultiplayerGames
+        return MultiplayerGames(trainee, history, loopers, randomer, BATCH_SIZE, PLAYERS, rng)
+    if BATCH_SIZE > 1:
+        from lockstep import LockstepGames
+        return LockstepGames(trainee, history, loopers, randomer, BATCH_SIZE, rng)
+    return None
+
+
+def main(args):
+    # 只在训练时用到的模块，可选的引擎（trajectory、replay、multiplayer、lockstep、parallel）在选中时才导入
+    from tqdm import tqdm
+    import checkpoint
+    from metrics import Metrics
+    trainee = Agent()
+    manifest = None
+    if len(args) > 0 and args[0] == "--resume":  # 从检查点继续训练：--resume [检查点路径] [超参数配置路径]
+        manifest = checkpoint.load(args[1] if len(args) > 1 else "checkpoint", trainee)
+        if len(args) > 2:
+            with open(args[2], "r") as f:
+                trainee.HYPERPARAMETER_DICT = json.load(f)
+    else:
+        trainee.init_q_table_and_configs(args)
+    print(trainee.HYPERPARAMETER_DICT)
+    random.seed(trainee.HYPERPARAMETER_DICT.get("SEED", 42))
+    randomer = Foolish(trainee.MOVEMENT_TABLE)
+    loopers = make_loopers()
     TOTAL_GAME_ROUND, TEST_PER_ROUND, COPY_PER_ROUND = trainee.HYPERPARAMETER_DICT["TOTAL_GAME_ROUND"], trainee.HYPERPARAMETER_DICT["TEST_PER_ROUND"], trainee.HYPERPARAMETER_DICT["COPY_PER_ROUND"]
+    PLAYERS = trainee.HYPERPARAMETER_DICT.get("PLAYERS", 2)
+    CHECKPOINT_PER_ROUND, CHECKPOINT_PATH = trainee.HYPERPARAMETER_DICT.get("CHECKPOINT_PER_ROUND", TEST_PER_ROUND), trainee.HYPERPARAMETER_DICT.get("CHECKPOINT_PATH", "checkpoint")
     history = []
+    WORKERS = trainee.HYPERPARAMETER_DICT.get("WORKERS", 1)
+    if trainee.HYPERPARAMETER_DICT.get("TRAJECTORY_PATH") is not None and WORKERS <= 1:  # 多进程训练时每个进程写自己的文件
+        import trajectory
+        trainee.trajectory = trajectory.TrajectoryWriter(trainee.HYPERPARAMETER_DICT["TRAJECTORY_PATH"], None if manifest is None else manifest.get("trajectory"))
+    if WORKERS <= 1:  # 多进程训练时每个进程有自己的重放缓冲区
+        trainee.replay = make_replay(trainee)
+    engine = None
+    if WORKERS > 1:  # 多进程训练，历史池由各个进程自己维护
+        import parallel  # parallel 导入了 train，只在多进程训练时导入
+        engine = parallel.ParallelTraining(trainee, WORKERS)
+    else:  # 多局游戏同步推进
+        engine = make_batch(trainee, history, loopers, randomer, np.random.default_rng(random.getrandbits(64)))
+    next_test = 0
+    if manifest is None:
+        open(trainee.map_path, "wb").close()  # 清空上次训练的帧
+    else:
+        history, next_test = checkpoint.restore(manifest, trainee, engine, loopers, randomer)
+    next_checkpoint = trainee.game_round - trainee.game_round % CHECKPOINT_PER_ROUND + CHECKPOINT_PER_ROUND if CHECKPOINT_PER_ROUND > 0 else float("inf")
+    metrics = Metrics(trainee.HYPERPARAMETER_DICT.get("METRICS_PATH", "metrics.jsonl"), trainee, trainee.HYPERPARAMETER_DICT.get("PROFILE_GAMES"), append=manifest is not None)
+    interrupted = []
+
+    def interrupt(signum, frame):  # 第一次 Ctrl+C 等这一步结束后保存检查点再退出，第二次直接中断
+        if len(interrupted) > 0:
+            raise KeyboardInterrupt
+        interrupted.append(signum)
+
+    signal.signal(signal.SIGINT, interrupt)  # 在创建工作进程之后设置，工作进程仍然使用默认的处理方式
     try:
-        for _ in tqdm(range(TOTAL_GAME_ROUND)):
-            if trainee.game_round % TEST_PER_ROUND == 0:
-                if trainee.game_round % COPY_PER_ROUND == 0:
-                    history.append(deepcopy(trainee))
-                    if len(history) > 20:
-                        history.pop(random.randint(0, len(history) - 1))
-                Agent.test(trainee, randomer, "Trainee vs Randomer")
-                for i in range(len(loopers)):
-                    Agent.test(trainee, loopers[i], "Trainee vs Looper " + str(i))
-                trainee.make_map()
-            r = random.random()
-            random_starts = random.random() < 0.6
-            if r < 0.6 and len(history) > 0:
-                trainee.play_round(random_starts, random.choice(history))
-            elif r < 0.8:
-                trainee.play_round(random_starts, trainee)
-            elif r < 0.95:
-                trainee.play_round(random_starts, random.choice(loopers))
-            else:
-                trainee.play_round(random_starts, randomer)
+        progress = tqdm(total=TOTAL_GAME_ROUND, initial=trainee.game_round)
+        while trainee.game_round < TOTAL_GAME_ROUND and len(interrupted) == 0:
+            metrics.profile()
+            if trainee.game_round >= next_test:
+                if next_test % COPY_PER_ROUND == 0 and WORKERS <= 1:
+                    with metrics.phase("history"):
+                        add_history(history, trainee)
+                with metrics.phase("test"):
+                    Agent.test(trainee, randomer, "Trainee vs Randomer")
+                    for i in range(len(loopers)):
+                        Agent.test(trainee, loopers[i], "Trainee vs Looper " + str(i))
+                    if PLAYERS > 2:
+                        import multiplayer
+                        multiplayer.test(trainee, [randomer] + loopers, PLAYERS, f"Trainee vs {PLAYERS - 1} players", trainee.HYPERPARAMETER_DICT["ROUND_PER_TEST"], np.random.default_rng(random.getrandbits(64)))
+                with metrics.phase("map"):
+                    trainee.make_map()
+                next_test += TEST_PER_ROUND
+                progress.set_postfix(metrics.record(), refresh=False)
+            if trainee.game_round >= next_checkpoint:
+                with metrics.phase("checkpoint"):
+                    checkpoint.save(CHECKPOINT_PATH, trainee, history, engine, next_test, loopers, randomer)
+                next_checkpoint = trainee.game_round - trainee.game_round % CHECKPOINT_PER_ROUND + CHECKPOINT_PER_ROUND
+            with metrics.phase("play"):
+                if engine is None:
+                    play_game(trainee, history, loopers, randomer)
+                    finished = 1
+                else:
+                    finished = engine.step()
+            progress.update(finished)
+        metrics.record()
+        progress.close()
+        if len(interrupted) > 0:
+            print("KeyboardInterrupt")
+            if WORKERS > 1:
+                engine.close()
+            checkpoint.save(CHECKPOINT_PATH, trainee, history, engine, next_test, loopers, randomer)
+            print(f"Saved checkpoint in {CHECKPOINT_PATH}, use --resume to continue")
+            exit()
         print("Finish all games.")
     except KeyboardInterrupt:
         print("KeyboardInterrupt")
         exit()
     else:
+        if WORKERS > 1:
+            engine.close()
+        checkpoint.save(CHECKPOINT_PATH, trainee, history, engine, next_test, loopers, randomer)  # 可以用更大的 TOTAL_GAME_ROUND 继续训练
         trainee.save_q_table_and_configs()
     finally:
-        trainee.make_webp("map.webp")
-        SMOOTHNESS = trainee.HYPERPARAMETER_DICT["SMOOTHNESS"]
-        for k, v in trainee.test_data.items():
-            smooth_data = [statistics.mean(v[i: i + SMOOTHNESS]) for i in range(len(v) - SMOOTHNESS)]
-            plt.plot(list(range(len(v) - SMOOTHNESS)), smooth_data, label=k, linewidth=1, linestyle="-", marker="o")
-        plt.title("Win Rate", fontsize=14, fontweight="bold")
-        plt.xlabel("Time", fontsize=12)
-        plt.ylabel("Win Rate", fontsize=12)
-        plt.legend(loc="upper left")
-        plt.grid(True, alpha=0.3)
-        plt.ylim(0, 1)
-        plt.tight_layout()
-        plt.savefig(f"winrate\\win_rate_{time.strftime('%Y-%m-%d_%H-%M-%S', time.localtime())}.png", dpi=300)
-        plt.show()
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+        metrics.close()
+        if trainee.trajectory is not None:
+            trainee.trajectory.close()
+        if WORKERS > 1:
+            engine.close()
+        trainee.save_test_data()
+        if not trainee.HYPERPARAMETER_DICT.get("HEADLESS", False):  # 无界面模式只保存原始数据，之后用 main.py -r 生成图片
+            import report
+            trainee.make_webp("map.webp")
+            report.plot_win_rate(trainee.test_data, trainee.HYPERPARAMETER_DICT["SMOOTHNESS"], os.path.join("winrate", f"win_rate_{time.strftime('%Y-%m-%d_%H-%M-%S', time.localtime())}.png"), show=True)
 
 if __name__ == "__main__":
     main(sys.argv[1:])
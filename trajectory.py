@@ -0,0 +1,164 @@
+import os
+import sys
+import json
+import struct
+import numpy as np
+from state_space import RAW_SIZE, OBSERVE
+
+# 轨迹文件：16 字节的文件头（MAGIC、版本、每条记录的字节数）之后是定长的记录，只追加
+# 每条记录是 Agent 的一步：桌号（逐局训练为 0）、这一局的第几步、这一步之后是否结束，双方这一步前后的真实状态编号（见 state_space.encode_raw），
+# 双方的动作编号（多人游戏中对手的动作记为 255），以及 Agent 得到的奖励。Q 表状态编号为 OBSERVE[own, opponent]
+MAGIC = b"HANDCLAP"
+VERSION = 2  # 版本 1 的桌号只有 16 位，BATCH_SIZE 超过 65536 时会回绕
+RECORD = np.dtype([
+    ("table", "<u4"), ("step", "u1"), ("done", "u1"),
+    ("own", "u1"), ("opponent", "u1"), ("next_own", "u1"), ("next_opponent", "u1"),
+    ("action", "u1"), ("opponent_action", "u1"), ("reward", "<f8")  # 奖励用 float64，重建 Q 表时与训练完全相同
+])
+RECORDS = {1: np.dtype([(name, "<u2" if name == "table" else RECORD.fields[name][0]) for name in RECORD.names]), VERSION: RECORD}  # 可以读取的版本，只写入当前版本
+PACKER = struct.Struct("<IBBBBBBBBd")  # 与 RECORD 相同的布局，逐条写入时用
+HEADER = np.dtype([("magic", "S8"), ("version", "<u4"), ("itemsize", "<u4")])
+BUFFER_RECORDS = 1 << 16  # 攒够这么多条记录再写入文件
+
+
+def check_header(path):  # 返回这个文件的记录格式
+    header = np.fromfile(path, dtype=HEADER, count=1)
+    if len(header) == 0 or header["magic"][0] != MAGIC:
+        raise ValueError(f"{path} is not a trajectory file")
+    version = int(header["version"][0])
+    if version not in RECORDS or header["itemsize"][0] != RECORDS[version].itemsize:
+        raise ValueError(f"Unsupported trajectory version {version}")
+    return RECORDS[version]
+
+
+def count(path):  # 文件中完整的记录数，写到一半的记录不算
+    return (os.path.getsize(path) - HEADER.itemsize) // check_header(path).itemsize
+
+
+class TrajectoryWriter:
+    def __init__(self, path, records=None):  # records 为从检查点继续时保留的记录数，None 表示新建文件
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        if records is None or not os.path.exists(path):
+            self.file = open(path, "wb")
+            self.file.write(np.array([(MAGIC, VERSION, RECORD.itemsize)], dtype=HEADER).tobytes())
+            self.written = 0
+        else:
+            if check_header(path) != RECORD:  # 旧版本的文件不能接着写
+                raise ValueError(f"Cannot append to {path}, it has an older trajectory version")
+            self.written = min(records, count(path))
+            self.file = open(path, "r+b")
+            self.file.truncate(HEADER.itemsize + self.written * RECORD.itemsize)  # 丢掉检查点之后写入的记录
+            self.file.seek(0, os.SEEK_END)
+        self.buffer = np.empty(BUFFER_RECORDS, dtype=RECORD)
+        self.bytes = memoryview(self.buffer.view(np.uint8))
+        self.used = 0
+
+    @property
+    def records(self):
+        return self.written + self.used
+
+    def record(self, *fields):  # 一条记录，字段顺序与 RECORD 相同；逐局训练时每次只有一条，直接打包进缓冲区
+        PACKER.pack_into(self.bytes, self.used * RECORD.itemsize, *fields)
+        self.used += 1
+        if self.used == len(self.buffer):
+            self.flush()
+
+    def extend(self, *columns):  # 一批记录，每个字段是一个数组或者标量
+        n = len(columns[2])
+        if self.used + n > len(self.buffer):
+            self.flush()
+        target = self.buffer[self.used:self.used + n] if n <= len(self.buffer) else np.empty(n, dtype=RECORD)
+        for name, column in zip(RECORD.names, columns):
+            target[name] = column
+        if n <= len(self.buffer):
+            self.used += n
+        else:
+            self.file.write(target.tobytes())
+            self.written += n
+
+    def flush(self):
+        if self.used > 0:
+            self.file.write(self.buffer[:self.used].tobytes())
+            self.written += self.used
+            self.used = 0
+        self.file.flush()
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+
+def open_log(path):  # 用 mmap 映射整个文件，不读入内存
+    record = check_header(path)
+    n = count(path)
+    if n == 0:
+        return np.empty(0, dtype=record)
+    return np.memmap(path, dtype=record, mode="r", offset=HEADER.itemsize, shape=(n,))
+
+
+def read(paths, batch=BUFFER_RECORDS):  # 依次读取每个文件，每次返回不超过 batch 条记录
+    for path in paths:
+        data = open_log(path)
+        for start in range(0, len(data), batch):
+            yield data[start:start + batch]
+
+
+def visits(paths):  # [我的真实状态, 对方的真实状态] 出现的次数
+    counts = np.zeros(RAW_SIZE * RAW_SIZE, dtype=np.int64)
+    for records in read(paths):
+        counts += np.bincount(records["own"].astype(np.int64) * RAW_SIZE + records["opponent"], minlength=len(counts))
+    return counts.reshape(RAW_SIZE, RAW_SIZE)
+
+
+def rebuild(paths, trainee, batch=1):  # 按记录的顺序重新进行 Q 学习
+    # 每次更新 batch 条记录，与训练时每一步的更新数（BATCH_SIZE，逐局训练为 1）相同时，同步推进的训练得到的 Q 表与训练完全相同
+    # 逐局训练时一局结束才把这一局的转移交给重放缓冲区，所以 batch 为 1 时不让 update_q_table_batch 直接交给缓冲区，而是按记录的 done 逐局交
+    replay = trainee.replay if batch == 1 else None
+    if replay is not None:
+        trainee.replay = None
+    for records in read(paths, max(BUFFER_RECORDS // batch, 1) * batch):
+        old_ids, new_ids = OBSERVE[records["own"], records["opponent"]], OBSERVE[records["next_own"], records["next_opponent"]]
+        actions, rewards = records["action"].astype(np.int64), records["reward"]
+        for start in range(0, len(records), batch):
+            trainee.update_q_table_batch(old_ids[start:start + batch], new_ids[start:start + batch], actions[start:start + batch], rewards[start:start + batch])
+            if replay is not None:
+                replay.record(int(old_ids[start]), int(new_ids[start]), int(actions[start]), float(rewards[start]))
+                if records["done"][start]:
+                    replay.flush()
+    if replay is not None:
+        replay.flush()
+        trainee.replay = replay
+
+
+def summary(paths):
+    total, games, reward = 0, 0, 0.0
+    for records in read(paths):
+        total += len(records)
+        games += int(records["done"].sum())
+        reward += float(records["reward"].sum())
+    return {"records": total, "games": games, "steps_per_game": total / max(games, 1), "mean_reward": reward / max(total, 1), "bytes": sum(os.path.getsize(p) for p in paths)}
+
+
+def main(args):
+    # trajectory.py stats 轨迹文件...                                   统计记录数、局数和平均奖励
+    # trajectory.py rebuild 超参数配置 输出路径 轨迹文件... [--batch n]    用记录的数据重新训练 Q 表
+    if args[0] == "stats":
+        print(json.dumps(summary(args[1:]), indent=2))
+    elif args[0] == "rebuild":
+        import joblib
+        import train
+        batch = 1
+        if "--batch" in args:
+            batch = int(args[args.index("--batch") + 1])
+            args = args[:args.index("--batch")] + args[args.index("--batch") + 2:]
+        trainee = train.Agent()
+        with open(args[1], "r") as f:
+            trainee.HYPERPARAMETER_DICT = json.load(f)
+        trainee.replay = train.make_replay(trainee)  # 训练时使用了优先级重放，重建时也要一样地重放
+        rebuild(args[3:], trainee, batch)
+        joblib.dump(trainee.Q_table.to_dict(), args[2], compress=4)
+        print(f"Saved Q_table in file {args[2]}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
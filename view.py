@@ -1,10 +1,106 @@
 import sys
-import joblib
+import json
+import itertools
+import numpy as np
+import policy
+from state_space import encode_states, decode
 
-if __name__ == "__main__":
-    s = joblib.load(sys.argv[1])
-    while True:
-        k = list(map(int, input().split()))
-        if k == "":
+# view.py Q 表路径                                                     逐行输入 4 个整数查询 Q 表，空行或 EOF 退出
+# view.py compile Q 表路径 输出前缀 [温度]                               把 Q 表编译为温度下的 softmax 策略，默认温度为 0.1
+# view.py compile-tree Q 表路径 输出前缀 [并行数]                          把决策树编译为策略
+# view.py query 策略前缀 [输入文件] [--json] [--raw] [--output 输出文件]     批量查询，不指定输入文件时从标准输入读取
+# 查询的每一行为 "我的生化 我的连续生化 对方生化 对方连续生化"，对方的状态默认是模糊后的（与 Q 表相同），--raw 表示真实状态
+CHUNK = 1 << 16  # 每次处理的行数
+
+
+def interactive(path):
+    import joblib
+    s = joblib.load(path)
+    for line in sys.stdin:
+        k = list(map(int, line.split()))
+        if len(k) == 0:
             break
-        print(s[((k[0], k[1]), (k[2], k[3]))])
\ No newline at end of file
+        state_id = int(encode_states([k])[0])
+        print(s.get(decode(state_id)) if state_id >= 0 else None)
+
+
+def read_states(lines):  # 按块读取，返回每块 [n, 4] 的整数数组
+    lines = (line for line in lines if line.strip())
+    while True:
+        chunk = [line.split() for line in itertools.islice(lines, CHUNK)]
+        if len(chunk) == 0:
+            return
+        if any(len(fields) != 4 for fields in chunk):
+            raise ValueError("Each query line must contain exactly 4 integers")
+        yield np.array(chunk, dtype=np.int64)
+
+
+def format_states(table, actions, as_json, name):  # 状态只有几千个，先把每个状态的输出格式化好，查询时直接拼接；name 为第二列的名称
+    best, probability, value = policy.query(table, np.arange(len(table)))
+    texts = []
+    for n in range(len(table)):
+        legal = np.flatnonzero(np.isfinite(value[n]))
+        if as_json:
+            texts.append(json.dumps({
+                "best": actions[best[n]],
+                "probability": {actions[a]: float(probability[n, a]) for a in legal},
+                name: {actions[a]: float(value[n, a]) for a in legal}
+            }, ensure_ascii=False)[1:])
+        else:
+            texts.append("\t".join([actions[best[n]]] + [f"{x:.6g}" for x in probability[n]] + [f"{x:.6g}" for x in value[n]]))
+    texts.append('"best": null}' if as_json else "\t".join(["invalid"] + [""] * (2 * len(actions))))  # 下标 -1 为非法状态
+    return texts
+
+
+def serve(prefix, source, out, as_json=False, raw=False):
+    table, meta = policy.load(prefix)
+    actions = meta["actions"]
+    name = "q" if meta.get("kind") == "q_table" else "score"  # 决策树的第二列是判断为可选的比例，不是 Q 值
+    texts = format_states(table, actions, as_json, name)
+    if not as_json:
+        out.write("\t".join(["i", "k", "j", "s", "best"] + ["p_" + a for a in actions] + [name + "_" + a for a in actions]) + "\n")
+    for states in read_states(source):
+        ids = encode_states(states, raw).tolist()
+        rows = states.tolist()  # 输出解析后的整数，输入中的 "03"、"+1" 等原样拼接会得到不合法的 JSON
+        if as_json:
+            out.write("".join('{"state": [' + ", ".join(map(str, row)) + "], " + texts[i] + "\n" for row, i in zip(rows, ids)))
+        else:
+            out.write("".join("\t".join(map(str, row)) + "\t" + texts[i] + "\n" for row, i in zip(rows, ids)))
+
+
+def main(args):
+    if args[0] == "compile":
+        from q_table import QTable
+        from rules import MOVEMENT_TABLE
+        import joblib
+        t = float(args[3]) if len(args) > 3 else 0.1
+        q_table = QTable.from_dict(joblib.load(args[1]), MOVEMENT_TABLE)
+        policy.save(args[2], policy.compile_q_table(q_table, t), q_table.actions, {"kind": "q_table", "temperature": t, "source": args[1]})
+        print(f"Saved policy in files {args[2]}.npy and {args[2]}.json")
+    elif args[0] == "compile-tree":
+        from rules import MOVEMENT_TABLE
+        table = policy.compile_tree(args[1], int(args[3]) if len(args) > 3 else -1)
+        policy.save(args[2], table, list(MOVEMENT_TABLE.keys()), {"kind": "tree", "source": args[1]})
+        print(f"Saved policy in files {args[2]}.npy and {args[2]}.json")
+    elif args[0] == "query":
+        flags = {"--json", "--raw"}
+        output = None
+        if "--output" in args:
+            output = args[args.index("--output") + 1]
+            args = args[:args.index("--output")] + args[args.index("--output") + 2:]
+        rest = [a for a in args[1:] if a not in flags]
+        source = open(rest[1], "r") if len(rest) > 1 else sys.stdin
+        out = open(output, "w", encoding="utf-8") if output is not None else sys.stdout
+        try:
+            serve(rest[0], source, out, "--json" in args, "--raw" in args)
+        finally:
+            if source is not sys.stdin:
+                source.close()
+            if out is not sys.stdout:
+                out.close()
+    else:
+        interactive(args[0])
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])